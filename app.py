@@ -1,18 +1,22 @@
 from flask import Flask, render_template, session, redirect, request, jsonify
 from flask_cors import CORS
-from flask_session import Session
 from apscheduler.schedulers.background import BackgroundScheduler
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 import os
+import time
+import pytz
  
 # Configuration and utility imports
-from config import SECRET_KEY, TOKENS_DIR, LABEL_NAME, GOOGLE_API_KEY
-from utils.auth import load_credentials, save_credentials
-from utils.gmail import ensure_label_exists
-from utils.calendar import create_calendar_event, fetch_calendar_events
-from utils.models import UserPreferences
+from config import SECRET_KEY, SESSION_BACKEND, LABEL_NAME, EMAIL_WORKERS, REFRESH_INTERVAL_MINUTES, PROCESSED_LEDGER_TTL
+from utils.auth import get_valid_credentials, list_user_ids, refresh_expiring_credentials
+from utils.gmail import ensure_label_exists, batch_get_messages, batch_modify_messages, sync_message_ids, extract_email_body
+from utils.calendar import build_event_body, batch_create_calendar_events, fetch_calendar_events, get_user_timezone
+from utils.models import UserPreferences, SyncCheckpoint, ProcessedMessages
+from utils.services import get_service, service_cache_stats
+from utils.extraction import extract_from_emails
+from utils.matching import get_interest_matcher
+from utils.conversation import prune_expired as prune_conversation_state
 
 app = Flask(__name__)
 # Fix CORS issues by allowing all routes and origins with proper configuration
@@ -23,18 +27,24 @@ CORS(app,
 
 # Configure session to be more robust
 app.secret_key = SECRET_KEY
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = True
-app.config['SESSION_USE_SIGNER'] = True
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 hours in seconds
 
-Session(app)
-
-# Configure the Generative AI model (used in blueprints)
-genai.configure(api_key=GOOGLE_API_KEY)
+# Session data is small (OAuth state and user identity), so a signed cookie is the default;
+# chat follow-up state lives in the shared storage database (utils.conversation) instead
+if SESSION_BACKEND == 'sqlite':
+    from utils.sessions import SqliteSessionInterface
+    app.session_interface = SqliteSessionInterface()
+elif SESSION_BACKEND == 'filesystem':
+    from flask_session import Session
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SESSION_PERMANENT'] = True
+    app.config['SESSION_USE_SIGNER'] = True
+    Session(app)
+elif SESSION_BACKEND != 'cookie':
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND!r} (expected cookie, sqlite or filesystem)")
 
 # Add a route to check session status
 @app.route('/api/session', methods=['GET'])
@@ -64,211 +74,239 @@ scheduler = BackgroundScheduler(daemon=True)
 scheduler.start()
 
 def process_emails():
-    """Periodic task to process emails and create calendar events."""
+    """Periodic task to process emails and create calendar events.
+
+    Users are handled on a bounded thread pool (``EMAIL_WORKERS``) so slow
+    Gmail/Gemini round trips for one user do not hold up the others. A
+    failure for one user is logged and does not affect the rest of the cycle.
+    """
     print("Processing emails...")
-    for token_file in os.listdir(TOKENS_DIR):
-        if not token_file.endswith('.json') or '_preferences' in token_file:
-            continue
-            
-        user_id = token_file.split('.')[0]
-        creds = load_credentials(user_id)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
+    cycle_start = time.monotonic()
+    user_ids = list_user_ids()
+
+    failed = 0
+    if EMAIL_WORKERS > 1 and len(user_ids) > 1:
+        with ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix='process-emails') as executor:
+            futures = {executor.submit(process_user_emails, user_id): user_id for user_id in user_ids}
+            for future in as_completed(futures):
                 try:
-                    creds.refresh(Request())
-                    save_credentials(user_id, creds)
+                    if not future.result():
+                        failed += 1
                 except Exception as e:
-                    print(f"Failed to refresh credentials for {user_id}: {e}")
-                    continue
-            else:
-                continue
+                    failed += 1
+                    print(f"Error processing emails for {futures[future]}: {e}")
+    else:
+        for user_id in user_ids:
+            try:
+                if not process_user_emails(user_id):
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                print(f"Error processing emails for {user_id}: {e}")
+
+    elapsed = time.monotonic() - cycle_start
+    print(f"Processed emails for {len(user_ids)} user(s) in {elapsed:.1f}s "
+          f"({failed} failed, {EMAIL_WORKERS} worker(s))")
+    print(f"Google API service cache: {service_cache_stats()}")
+
+def process_user_emails(user_id):
+    """Process new emails for a single user and create calendar events.
+
+    Returns False if processing failed for this user, True otherwise.
+    """
+    try:
+        creds = get_valid_credentials(user_id)
+    except Exception as e:
+        print(f"Failed to refresh credentials for {user_id}: {e}")
+        return False
+    if not creds:
+        return True
+    try:
+        # Load user preferences
+        user_preferences = UserPreferences.load_preferences(user_id)
+        if not user_preferences.get('enabled', True):
+            print(f"Email processing disabled for user {user_id}")
+            return True
+            
+        # Get user interests for filtering
+        user_interests = user_preferences.get('interests', [])
+        interest_matcher = get_interest_matcher(user_id, user_interests)
+        
+        gmail_service = get_service('gmail', 'v1', creds)
+        label_id = ensure_label_exists(gmail_service, LABEL_NAME)
+        if not label_id:
+            return False
+        query = f"-label:{LABEL_NAME}"
+        # Only fetch messages added since the last checkpoint (full resync if it is missing or expired)
+        message_ids, new_history_id = sync_message_ids(
+            gmail_service,
+            SyncCheckpoint.load_history_id(user_id),
+            query,
+            exclude_label_ids=[label_id]
+        )
+        # Messages already in the ledger got their event on an earlier cycle (e.g. labeling failed); just relabel them
+        already_processed = ProcessedMessages.already_processed(user_id, message_ids) if message_ids else set()
+        failed_ids = set()
+        fetched = batch_get_messages(gmail_service, [msg_id for msg_id in message_ids if msg_id not in already_processed],
+                                     failed_ids=failed_ids)
+        processed_ids = list(already_processed)
         try:
-            # Load user preferences
-            user_preferences = UserPreferences.load_preferences(user_id)
-            if not user_preferences.get('enabled', True):
-                print(f"Email processing disabled for user {user_id}")
-                continue
-                
-            # Get user interests for filtering
-            user_interests = user_preferences.get('interests', [])
+            candidates = []
+            for msg_id in message_ids:
+                message = fetched.get(msg_id)
+                if message is None or label_id in message.get('labelIds', []):
+                    continue
             
-            gmail_service = build('gmail', 'v1', credentials=creds)
-            label_id = ensure_label_exists(gmail_service, LABEL_NAME)
-            if not label_id:
-                continue
-            query = f"-label:{LABEL_NAME}"
-            response = gmail_service.users().messages().list(
-                userId='me',
-                q=query,
-                maxResults=10  # Increased to give more filtering options
-            ).execute()
-            messages = response.get('messages', [])
-            for msg in messages:
-                msg_id = msg['id']
-                message = gmail_service.users().messages().get(
-                    userId='me',
-                    id=msg_id,
-                    format='full'  # Changed to full to get content
-                ).execute()
-                
                 # Extract email details
                 headers = message.get('payload', {}).get('headers', [])
                 subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
                 sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
                 date_str = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
-                
+            
                 # Extract email content
-                from utils.gmail import extract_email_body
                 email_body = extract_email_body(message.get('payload', {}))
-                
+            
                 # If user has interests and filtering is enabled, check if email matches interests
                 if user_interests:
-                    matches_interest = False
-                    email_content = f"{subject} {email_body}".lower()
-                    
-                    for interest in user_interests:
-                        if interest.lower() in email_content:
-                            matches_interest = True
-                            print(f"Email matched interest: {interest}")
-                            break
-                            
-                    if not matches_interest:
+                    matched_interest = interest_matcher.search(f"{subject} {email_body}")
+                    if matched_interest:
+                        print(f"Email matched interest: {matched_interest}")
+                    else:
                         print(f"Email doesn't match user interests: {subject}")
                         # Mark as processed without creating an event
-                        gmail_service.users().messages().modify(
-                            userId='me',
-                            id=msg_id,
-                            body={'addLabelIds': [label_id]}
-                        ).execute()
+                        processed_ids.append(msg_id)
                         continue
-                
-                # Use AI to extract the actual event date from the email content
-                import google.generativeai as genai
-                
-                prompt = f"""
-                Email Subject: {subject}
-                Email Content: {email_body}
-                
-                Extract the following information from this email:
-                1. The SPECIFIC date and time of the event mentioned (EXACT DATE AND TIME, not relative dates)
-                2. The location of the event (if mentioned)
-                3. A brief description of what this event is about
-                
-                Format your response as JSON:
-                {{
-                    "event_date": "YYYY-MM-DD HH:MM" or "none" if not found,
-                    "location": "location string or 'none' if not found",
-                    "description": "brief description of the event"
-                }}
-                
-                IMPORTANT: For the event_date, you must provide the EXACT date and time in YYYY-MM-DD HH:MM format.
-                Do not use "tomorrow", "next week", or any other relative dates. Convert them to actual calendar dates.
-                """
-                
+            
+                candidates.append({
+                    'id': msg_id,
+                    'subject': subject,
+                    'sender': sender,
+                    'date': date_str,
+                    'content': email_body,
+                    'internal_date': int(message.get('internalDate', 0))
+                })
+            
+            # Use AI to extract the actual event dates, several emails per prompt
+            timezone_str = get_user_timezone(creds, user_id) if candidates else None
+            extractions = extract_from_emails('calendar_event', candidates, user_id=user_id, timezone_str=timezone_str)
+            event_bodies = [build_event_from_email(email, extractions.get(email['id']), timezone_str) for email in candidates]
+            
+            # Insert every event in batched round trips; retry failures with a plain event at the email date
+            results = batch_create_calendar_events(creds, event_bodies)
+            retry = [email for email, result in zip(candidates, results) if result['status'] != 'created']
+            for email, result in zip(candidates, results):
+                if result['status'] == 'created':
+                    # Mark as processed
+                    processed_ids.append(email['id'])
+            if retry:
+                results = batch_create_calendar_events(creds, [build_fallback_event(email, timezone_str) for email in retry])
+                for email, result in zip(retry, results):
+                    if result['status'] == 'created':
+                        processed_ids.append(email['id'])
+                unprocessed = len(retry) - sum(result['status'] == 'created' for result in results)
+                if unprocessed:
+                    # Keep the checkpoint where it is so these emails are picked up again next cycle
+                    raise RuntimeError(f"Failed to create {unprocessed} calendar event(s)")
+        finally:
+            # Record handled messages before labeling, so a labeling failure cannot cause duplicate events
+            ProcessedMessages.record(user_id, [msg_id for msg_id in processed_ids if msg_id not in already_processed])
+            # Label everything handled this cycle in one batched round trip
+            if processed_ids:
+                batch_modify_messages(gmail_service, processed_ids, {'addLabelIds': [label_id]})
+        if failed_ids:
+            # History is only read forward, so keep the old checkpoint until every message could be fetched
+            print(f"Could not fetch {len(failed_ids)} message(s) for {user_id}; keeping the sync checkpoint")
+        elif new_history_id:
+            SyncCheckpoint.save_history_id(user_id, new_history_id)
+    except Exception as e:
+        print(f"Error processing emails for {user_id}: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+    return True
+
+def email_local_time(email, timezone_str):
+    """The email's received time as a naive datetime in the user's timezone."""
+    return datetime.fromtimestamp(email['internal_date'] / 1000, pytz.timezone(timezone_str)).replace(tzinfo=None)
+
+def build_event_from_email(email, extracted_data, timezone_str):
+    """Build the calendar event body for an email from the extracted event details.
+
+    Falls back to the email's own timestamp when no event date was extracted.
+    """
+    subject = email['subject']
+    sender = email['sender']
+    date_str = email['date']
+    try:
+        if extracted_data is not None:
+            # Get the event date from the extraction or use email date as fallback
+            event_date = extracted_data.get('event_date', 'none')
+            location = extracted_data.get('location', 'none')
+            event_description = extracted_data.get('description', '')
+        
+            if event_date and event_date.lower() != 'none':
+                # Parse the event date
                 try:
-                    # Configure the AI model if not already done
-                    if not genai.get_default_api_key():
-                        genai.configure(api_key=GOOGLE_API_KEY)
-                    
-                    model = genai.GenerativeModel("gemini-1.5-flash")
-                    response = model.generate_content(prompt)
-                    
-                    if response and response.text:
-                        # Extract the JSON response
-                        import json
-                        import re
-                        
-                        response_text = response.text.strip()
-                        # Extract JSON if it's wrapped in code blocks
-                        if "```json" in response_text:
-                            json_str = response_text.split("```json")[1].split("```")[0].strip()
-                        elif "```" in response_text:
-                            json_str = response_text.split("```")[1].strip()
-                        else:
-                            json_str = response_text
-                            
-                        # Parse the extracted JSON
-                        extracted_data = json.loads(json_str)
-                        
-                        # Get the event date from the extraction or use email date as fallback
-                        event_date = extracted_data.get('event_date', 'none')
-                        location = extracted_data.get('location', 'none')
-                        event_description = extracted_data.get('description', '')
-                        
-                        if event_date and event_date.lower() != 'none':
-                            # Parse the event date
-                            from datetime import datetime
-                            try:
-                                # Try with standard format first
-                                event_dt = datetime.strptime(event_date, "%Y-%m-%d %H:%M")
-                                print(f"Successfully parsed event date using standard format: {event_date}")
-                            except Exception as date_error:
-                                try:
-                                    # Try with dateutil parser which is more flexible
-                                    from dateutil import parser
-                                    event_dt = parser.parse(event_date)
-                                    print(f"Successfully parsed event date using dateutil: {event_date} -> {event_dt}")
-                                except Exception as parser_error:
-                                    print(f"Error parsing event date with both methods: {date_error} and {parser_error}")
-                                    # Fallback to email date
-                                    internal_date = int(message.get('internalDate', 0))
-                                    event_dt = datetime.utcfromtimestamp(internal_date / 1000)
-                                    print(f"Using fallback email timestamp: {event_dt}")
-                                
-                            # Create ISO format date - without the Z suffix to avoid UTC designation
-                            iso_date = event_dt.isoformat()
-                            print(f"Extracted event date: {event_date} -> ISO format: {iso_date}")
-                        else:
-                            # Use email date if no event date found
-                            print(f"No event date found in: {subject}, using email date")
-                            internal_date = int(message.get('internalDate', 0))
-                            event_dt = datetime.utcfromtimestamp(internal_date / 1000)
-                            iso_date = event_dt.isoformat()
-                        
-                        # Enhanced event description with location
-                        full_description = f"From: {sender}\nDate: {date_str}\nSubject: {subject}"
-                        if event_description:
-                            full_description += f"\n\nDetails: {event_description}"
-                        if location and location.lower() != 'none':
-                            full_description += f"\n\nLocation: {location}"
-                            
-                        # Create calendar event with the extracted date and enhanced description
-                        create_calendar_event(
-                            creds, 
-                            subject, 
-                            sender, 
-                            date_str, 
-                            iso_date, 
-                            description=full_description,
-                            set_reminder=True
-                        )
-                    else:
-                        # Fallback to email date if AI extraction fails
-                        internal_date = int(message.get('internalDate', 0))
-                        event_dt = datetime.utcfromtimestamp(internal_date / 1000)
-                        iso_date = event_dt.isoformat()
-                        create_calendar_event(creds, subject, sender, date_str, iso_date)
-                        
-                except Exception as ai_error:
-                    print(f"Error using AI to extract date: {ai_error}")
-                    # Fallback to email date
-                    internal_date = int(message.get('internalDate', 0))
-                    event_dt = datetime.utcfromtimestamp(internal_date / 1000)
-                    iso_date = event_dt.isoformat()
-                    create_calendar_event(creds, subject, sender, date_str, iso_date)
+                    # Try with standard format first
+                    event_dt = datetime.strptime(event_date, "%Y-%m-%d %H:%M")
+                    print(f"Successfully parsed event date using standard format: {event_date}")
+                except Exception as date_error:
+                    try:
+                        # Try with dateutil parser which is more flexible
+                        from dateutil import parser
+                        event_dt = parser.parse(event_date)
+                        print(f"Successfully parsed event date using dateutil: {event_date} -> {event_dt}")
+                    except Exception as parser_error:
+                        print(f"Error parsing event date with both methods: {date_error} and {parser_error}")
+                        # Fallback to email date
+                        event_dt = email_local_time(email, timezone_str)
+                        print(f"Using fallback email timestamp: {event_dt}")
                 
-                # Mark as processed
-                gmail_service.users().messages().modify(
-                    userId='me',
-                    id=msg_id,
-                    body={'addLabelIds': [label_id]}
-                ).execute()
-        except Exception as e:
-            print(f"Error processing emails for {user_id}: {e}")
-            import traceback
-            print(traceback.format_exc())
+                # Create ISO format date - without the Z suffix to avoid UTC designation
+                iso_date = event_dt.isoformat()
+                print(f"Extracted event date: {event_date} -> ISO format: {iso_date}")
+            else:
+                # Use email date if no event date found
+                print(f"No event date found in: {subject}, using email date")
+                event_dt = email_local_time(email, timezone_str)
+                iso_date = event_dt.isoformat()
+        
+            # Enhanced event description with location
+            full_description = f"From: {sender}\nDate: {date_str}\nSubject: {subject}"
+            if event_description:
+                full_description += f"\n\nDetails: {event_description}"
+            if location and location.lower() != 'none':
+                full_description += f"\n\nLocation: {location}"
+            
+            # Calendar event with the extracted date and enhanced description
+            return build_event_body(
+                subject, 
+                sender, 
+                date_str, 
+                iso_date, 
+                description=full_description,
+                set_reminder=True,
+                timezone_str=timezone_str,
+                source_id=email['id']
+            )
+    except Exception as ai_error:
+        print(f"Error using AI to extract date: {ai_error}")
+
+    return build_fallback_event(email, timezone_str)
+
+def build_fallback_event(email, timezone_str):
+    """Build a plain calendar event body at the email's own timestamp."""
+    event_dt = email_local_time(email, timezone_str)
+    return build_event_body(email['subject'], email['sender'], email['date'], event_dt.isoformat(),
+                            timezone_str=timezone_str, source_id=email['id'])
 
 scheduler.add_job(func=process_emails, trigger='interval', minutes=50)
+scheduler.add_job(func=refresh_expiring_credentials, trigger='interval', minutes=REFRESH_INTERVAL_MINUTES)
+scheduler.add_job(func=ProcessedMessages.prune, args=[PROCESSED_LEDGER_TTL], trigger='interval', hours=24)
+scheduler.add_job(func=prune_conversation_state, trigger='interval', hours=1)
+if SESSION_BACKEND == 'sqlite':
+    from utils.sessions import prune_expired
+    scheduler.add_job(func=prune_expired, trigger='interval', hours=1)
 
 # Import and register blueprints
 from routes.auth_routes import auth_bp
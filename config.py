@@ -7,14 +7,62 @@ load_dotenv()
 # Allow OAuthlib to run without HTTPS for local development
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
-# Flask secret key (used for sessions)
-SECRET_KEY = os.urandom(24)
+# Flask secret key (signs session cookies). Taken from the environment, or generated once and
+# persisted to SECRET_KEY_FILE so sessions survive restarts and are shared by every worker
+SECRET_KEY_FILE = os.getenv("SECRET_KEY_FILE", "flask_secret.key")
+
+def _load_secret_key():
+    if os.getenv("SECRET_KEY"):
+        return os.getenv("SECRET_KEY")
+    if not os.path.exists(SECRET_KEY_FILE):
+        # Write the key to a temp file and link it into place, so the key file only ever appears
+        # fully written; if several workers start at once, the first link wins and the rest read it
+        tmp_path = f"{SECRET_KEY_FILE}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        try:
+            os.link(tmp_path, SECRET_KEY_FILE)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(SECRET_KEY_FILE, 'rb') as f:
+        key = f.read()
+    if len(key) < 16:
+        raise RuntimeError(f"{SECRET_KEY_FILE} does not hold a usable secret key; delete it or set SECRET_KEY")
+    return key
+
+SECRET_KEY = _load_secret_key()
+
+# Where Flask sessions live: "cookie" (signed cookie, no server state), "sqlite" (session rows in
+# STORAGE_PATH, only an ID in the cookie) or "filesystem" (Flask-Session files, the old behaviour)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").lower()
 
 # Token storage & encryption configuration
 TOKENS_DIR = "tokens"
 KEY_FILE = "secret.key"
 LABEL_NAME = "AddedToCalendar"
 
+# SQLite database holding users' credentials, preferences, sync checkpoints and processed-message ledger
+STORAGE_PATH = os.getenv("STORAGE_PATH", os.path.join(TOKENS_DIR, "rundown.sqlite3"))
+
+# How long processed message IDs are remembered in the ledger, in seconds
+PROCESSED_LEDGER_TTL = int(os.getenv("PROCESSED_LEDGER_TTL", str(90 * 24 * 3600)))
+
+# Maximum number of users whose decrypted credentials are kept in memory
+CREDENTIALS_CACHE_SIZE = int(os.getenv("CREDENTIALS_CACHE_SIZE", "1024"))
+
+# Maximum number of users whose preferences are kept in memory, and how long a cached copy is
+# trusted before its stored version is re-checked (bounds staleness across processes)
+PREFERENCES_CACHE_SIZE = int(os.getenv("PREFERENCES_CACHE_SIZE", "4096"))
+PREFERENCES_REVALIDATE_SECONDS = float(os.getenv("PREFERENCES_REVALIDATE_SECONDS", "30"))
+
+# Tokens expiring within this many seconds are refreshed by the background job,
+# which runs every REFRESH_INTERVAL_MINUTES (keep the margin larger than the interval)
+REFRESH_MARGIN_SECONDS = int(os.getenv("REFRESH_MARGIN_SECONDS", "900"))
+REFRESH_INTERVAL_MINUTES = int(os.getenv("REFRESH_INTERVAL_MINUTES", "5"))
+
 # Google API scopes required by your app
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.labels',
@@ -29,3 +77,65 @@ SCOPES = [
 
 # Google API key for generative AI (make sure to set it in your .env file)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# Scheduler: number of users processed concurrently per email cycle (1 = sequential)
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "8"))
+
+# Maximum number of unprocessed messages fetched when a user's Gmail sync checkpoint is missing or expired
+FULL_SYNC_MAX_MESSAGES = int(os.getenv("FULL_SYNC_MAX_MESSAGES", "50"))
+
+# Google API client cache: maximum cached service objects and their lifetime in seconds
+SERVICE_CACHE_SIZE = int(os.getenv("SERVICE_CACHE_SIZE", "256"))
+SERVICE_CACHE_TTL = int(os.getenv("SERVICE_CACHE_TTL", "1800"))
+
+# Maximum number of Gemini requests in flight across the process; extra calls queue
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Persistent cache of LLM extraction results (SQLite), with entry lifetime in seconds and LRU size bound
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", os.path.join(TOKENS_DIR, "extraction_cache.sqlite3"))
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", str(30 * 24 * 3600)))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "50000"))
+
+# Batched email extraction: most emails per Gemini prompt and approximate prompt size budget in characters
+LLM_BATCH_MAX_EMAILS = int(os.getenv("LLM_BATCH_MAX_EMAILS", "8"))
+LLM_BATCH_CHAR_BUDGET = int(os.getenv("LLM_BATCH_CHAR_BUDGET", "24000"))
+
+# Per-user calendar event store: serve reads from memory for EVENT_STORE_TTL seconds, then sync
+# incrementally with a syncToken; force a full resync after EVENT_STORE_MAX_AGE seconds
+EVENT_STORE_TTL = int(os.getenv("EVENT_STORE_TTL", "60"))
+EVENT_STORE_MAX_AGE = int(os.getenv("EVENT_STORE_MAX_AGE", str(6 * 3600)))
+EVENT_STORE_LOOKBACK_DAYS = int(os.getenv("EVENT_STORE_LOOKBACK_DAYS", "30"))
+EVENT_STORE_MAX_USERS = int(os.getenv("EVENT_STORE_MAX_USERS", "1000"))
+
+# Availability: working hours (HH:MM, user's timezone) and the shortest free slot worth offering
+WORK_DAY_START = os.getenv("WORK_DAY_START", "09:00")
+WORK_DAY_END = os.getenv("WORK_DAY_END", "20:00")
+MIN_SLOT_MINUTES = int(os.getenv("MIN_SLOT_MINUTES", "30"))
+
+# Time suggestions: how many days from the requested one to search, start-time granularity in
+# minutes, free buffer wanted around a suggestion, and how many alternatives to offer
+SUGGEST_SEARCH_DAYS = int(os.getenv("SUGGEST_SEARCH_DAYS", "3"))
+SUGGEST_STEP_MINUTES = int(os.getenv("SUGGEST_STEP_MINUTES", "15"))
+SUGGEST_BUFFER_MINUTES = int(os.getenv("SUGGEST_BUFFER_MINUTES", "15"))
+SUGGEST_ALTERNATIVES = int(os.getenv("SUGGEST_ALTERNATIVES", "3"))
+
+# Calendars whose busy time counts for availability (comma-separated calendar IDs, one freeBusy call)
+AVAILABILITY_CALENDAR_IDS = [c.strip() for c in os.getenv("AVAILABILITY_CALENDAR_IDS", "primary").split(",") if c.strip()]
+
+# Timezone used when a user's Calendar timezone cannot be read
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "America/New_York")
+
+# Chat context: seconds to wait for calendar/email context before answering without it, and fetch threads
+CHAT_CONTEXT_DEADLINE = float(os.getenv("CHAT_CONTEXT_DEADLINE", "4"))
+CONTEXT_WORKERS = int(os.getenv("CONTEXT_WORKERS", "8"))
+
+# Extraction batches run on this many threads; /addsuggestion returns what finished within its deadline (seconds)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(LLM_MAX_CONCURRENCY)))
+SUGGESTION_DEADLINE = float(os.getenv("SUGGESTION_DEADLINE", "25"))
+
+# Background jobs (e.g. /addsuggestion job mode): worker threads and seconds results are kept after the last update
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "600"))
+
+# Seconds that chat follow-up state (the suggested event) is kept after the command that produced it
+CONVERSATION_STATE_TTL = int(os.getenv("CONVERSATION_STATE_TTL", "1800"))
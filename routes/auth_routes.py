@@ -1,7 +1,10 @@
 from flask import Blueprint, redirect, request, session, render_template, jsonify, make_response, url_for
-from googleapiclient.discovery import build
 from config import SECRET_KEY, SCOPES
-from utils.auth import get_flow, save_credentials
+from utils.auth import get_flow, save_credentials, invalidate_credentials
+from utils.services import get_service
+from utils.calendar import get_user_timezone
+from utils import conversation
+from utils.sessions import regenerate_session
 import traceback
 
 auth_bp = Blueprint('auth', __name__)
@@ -41,17 +44,22 @@ def callback():
         creds = flow.credentials
         
         # Get user information
-        user_info_service = build('oauth2', 'v2', credentials=creds)
+        user_info_service = get_service('oauth2', 'v2', creds)
         user_info = user_info_service.userinfo().get().execute()
         user_id = user_info['id']
         
-        # Save credentials and set session
+        # Save credentials and set session, under a new session ID so a planted one cannot be reused
         save_credentials(user_id, creds)
+        session.pop('state', None)
+        regenerate_session()
         session['user_id'] = user_id
         session['user_email'] = user_info.get('email', '')
         session['user_name'] = user_info.get('name', '')
         session.permanent = True
         
+        # Re-read the Calendar timezone on each login in case the user changed it
+        get_user_timezone(creds, user_id, refresh=True)
+        
         print(f"User authenticated: {user_id} ({session['user_email']})")
         
         # Set a cookie to track successful authentication
@@ -89,7 +97,11 @@ def scope_changed():
 
 @auth_bp.route('/logout')
 def logout():
-    # Clear all session data
+    # Drop cached credentials and chat follow-up state, then clear all session data
+    # (a server-side session row is deleted when the emptied session is saved)
+    if 'user_id' in session:
+        invalidate_credentials(session['user_id'])
+        conversation.forget(session['user_id'])
     session.clear()
     resp = make_response(redirect('/'))
     # Clear cookies
@@ -1,12 +1,17 @@
 from flask import Blueprint, jsonify, session, redirect, request, current_app
-from google.auth.transport.requests import Request
 from googleapiclient.errors import HttpError
-from utils.calendar import fetch_calendar_events, delete_calendar_event
-from utils.auth import load_credentials, save_credentials, require_auth
+from utils.calendar import (
+    fetch_calendar_events, delete_calendar_event, build_event_body,
+    batch_create_calendar_events, batch_delete_calendar_events, get_user_timezone,
+)
+from utils.auth import get_valid_credentials, require_auth
 import traceback
 
 calendar_bp = Blueprint('calendar', __name__)
 
+# Most create + delete operations accepted by one /calendar/batch request
+MAX_BATCH_OPERATIONS = 200
+
 @calendar_bp.route('/calendar', methods=['GET', 'OPTIONS'])
 @require_auth
 def calendar_events_route():
@@ -20,18 +25,14 @@ def calendar_events_route():
             print("No user_id in session")
             return jsonify({"error": "Authentication required", "redirect": "/login"}), 401
             
-        creds = load_credentials(user_id)
+        try:
+            creds = get_valid_credentials(user_id)
+        except Exception as refresh_error:
+            print(f"Refresh failed: {str(refresh_error)}")
+            return jsonify({"error": "Failed to refresh credentials", "redirect": "/login"}), 401
         if not creds:
             print("No credentials found in storage")
             return jsonify({"error": "No credentials found", "redirect": "/login"}), 401
-            
-        if creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                save_credentials(user_id, creds)
-            except Exception as refresh_error:
-                print(f"Refresh failed: {str(refresh_error)}")
-                return jsonify({"error": "Failed to refresh credentials", "redirect": "/login"}), 401
                 
         events = fetch_calendar_events(creds)
         return jsonify({"events": events})
@@ -69,19 +70,14 @@ def delete_calendar_event_route():
             
         print(f"Attempting to delete calendar event {event_id} for user {user_id}")
         
-        creds = load_credentials(user_id)
+        try:
+            creds = get_valid_credentials(user_id)
+        except Exception as refresh_error:
+            print(f"Credential refresh failed: {str(refresh_error)}")
+            return jsonify({"error": "Failed to refresh credentials", "redirect": "/login"}), 401
         if not creds:
             print("No credentials found")
             return jsonify({"error": "Authentication required", "redirect": "/login"}), 401
-            
-        if creds.expired and creds.refresh_token:
-            try:
-                print("Refreshing expired credentials")
-                creds.refresh(Request())
-                save_credentials(user_id, creds)
-            except Exception as refresh_error:
-                print(f"Credential refresh failed: {str(refresh_error)}")
-                return jsonify({"error": "Failed to refresh credentials", "redirect": "/login"}), 401
                 
         print("Calling delete_calendar_event function")
         result = delete_calendar_event(creds, event_id)
@@ -102,3 +98,81 @@ def delete_calendar_event_route():
         print(f"Unexpected error in delete_calendar_event_route: {str(e)}")
         print(traceback.format_exc())
         return jsonify({"error": f"Server Error: {str(e)}"}), 500
+
+@calendar_bp.route('/calendar/batch', methods=['POST', 'OPTIONS'])
+@require_auth
+def batch_calendar_events_route():
+    """Create and/or delete several calendar events in batched API calls.
+    
+    Body: {"create": [{"title", "start", "end"?, "description"?, "set_reminder"?, "email_id"?}, ...],
+           "delete": ["event_id", ...]}
+    
+    email_id is the source email of an accepted suggestion; it is stored on the
+    event so suggestion dedup and the email processor recognise it.
+    """
+    # Handle CORS preflight requests
+    if request.method == 'OPTIONS':
+        return '', 200
+        
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            print("No user_id in session")
+            return jsonify({"error": "Authentication required", "redirect": "/login"}), 401
+        
+        data = request.get_json(silent=True) or {}
+        to_create = data.get('create') or []
+        to_delete = data.get('delete') or []
+        if not isinstance(to_create, list) or not isinstance(to_delete, list):
+            return jsonify({"error": "'create' and 'delete' must be lists"}), 400
+        if not to_create and not to_delete:
+            return jsonify({"error": "Nothing to create or delete"}), 400
+        if len(to_create) + len(to_delete) > MAX_BATCH_OPERATIONS:
+            return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per request"}), 400
+        
+        for item in to_create:
+            if not isinstance(item, dict) or not item.get('title') or not item.get('start'):
+                return jsonify({"error": "Each event to create needs a title and start"}), 400
+        
+        try:
+            creds = get_valid_credentials(user_id)
+        except Exception as refresh_error:
+            print(f"Credential refresh failed: {str(refresh_error)}")
+            return jsonify({"error": "Failed to refresh credentials", "redirect": "/login"}), 401
+        if not creds:
+            print("No credentials found")
+            return jsonify({"error": "Authentication required", "redirect": "/login"}), 401
+        
+        timezone_str = get_user_timezone(creds, user_id) if to_create else None
+        event_bodies = []
+        for item in to_create:
+            event_bodies.append(build_event_body(
+                item['title'],
+                "Added from RunDown",
+                item['start'],
+                item['start'],
+                end_date=item.get('end'),
+                description=item.get('description'),
+                set_reminder=bool(item.get('set_reminder')),
+                timezone_str=timezone_str,
+                source_id=item.get('email_id')
+            ))
+        
+        created = batch_create_calendar_events(creds, event_bodies) if event_bodies else []
+        deleted = batch_delete_calendar_events(creds, [str(event_id) for event_id in to_delete]) if to_delete else {}
+        
+        success = (all(result["status"] == "created" for result in created)
+                   and all(status in ("deleted", "not_found") for status in deleted.values()))
+        return jsonify({
+            "success": success,
+            "created": [
+                {"status": "created", "id": result["event"].get("id"), "htmlLink": result["event"].get("htmlLink")}
+                if result["status"] == "created" else result
+                for result in created
+            ],
+            "deleted": deleted
+        })
+    except Exception as e:
+        print(f"Unexpected error in batch_calendar_events_route: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"Server Error: {str(e)}"}), 500
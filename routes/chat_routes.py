@@ -1,25 +1,39 @@
 from flask import current_app
-from flask import Blueprint, request, jsonify, session
-import google.generativeai as genai
-from config import GOOGLE_API_KEY
-from utils.calendar import fetch_calendar_events, create_calendar_event, delete_calendar_event
+from flask import Blueprint, request, jsonify, session, g, Response, stream_with_context
+from utils.calendar import fetch_calendar_events, fetch_busy_intervals, create_calendar_event, delete_calendar_event, get_user_timezone
 from utils.gmail import fetch_emails
 from utils.auth import load_credentials, require_auth
 from utils.models import UserPreferences
+from utils.llm import generate_content, stream_content, parse_json_response
+from utils.dates import parse_temporal, HIGH
+from utils.matching import get_interest_matcher
+from utils.availability import AvailabilityIndex, DEFAULT_WORK_START, DEFAULT_WORK_END
+from utils.extraction import extract_from_emails
+from utils.context import build_context
+from utils.jobs import start_job, get_job
+from utils import conversation
+from utils.event_store import get_fingerprints
+from utils.fingerprints import source_fingerprint, title_fingerprint
+from config import SUGGEST_SEARCH_DAYS, SUGGEST_ALTERNATIVES, DEFAULT_TIMEZONE, SUGGESTION_DEADLINE
 import json
 from datetime import datetime, timedelta, time
 import traceback
 import re
 import os
 import pytz
-from google.generativeai import GenerativeModel
 from functools import wraps
 
 chat_bp = Blueprint('chat', __name__)
 
-# Configure the Generative AI model
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel("gemini-1.5-flash")
+def user_timezone(creds):
+    """The signed-in user's timezone name, looked up at most once per request"""
+    if 'user_timezone' not in g:
+        g.user_timezone = get_user_timezone(creds, session.get('user_id'))
+    return g.user_timezone
+
+def user_now(creds):
+    """Current wall-clock time in the user's timezone, as a naive datetime"""
+    return datetime.now(pytz.timezone(user_timezone(creds))).replace(tzinfo=None)
 
 @chat_bp.route('/chat', methods=['POST'])
 @require_auth
@@ -32,12 +46,9 @@ def chat():
         
         # Handle follow-up requests
         if data.get('follow_up') and data.get('action') == 'add_event':
-            # Create an event from the stored suggestion
-            suggested_event = session.get('suggested_event')
+            # Create an event from the stored suggestion (each suggestion is used at most once)
+            suggested_event = conversation.take(user_id, 'suggested_event')
             if suggested_event:
-                # Clear session data
-                session.pop('suggested_event', None)
-                
                 # Get credentials
                 creds = load_credentials(user_id)
                 
@@ -61,7 +72,7 @@ def chat():
                 iso_end = end_dt.isoformat()
                 
                 # Create the calendar event
-                description = f"Created via RunDown Chatbot\n\nScheduled on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                description = f"Created via RunDown Chatbot\n\nScheduled on {user_now(creds).strftime('%Y-%m-%d %H:%M:%S')}"
                 
                 try:
                     event = create_calendar_event(
@@ -72,7 +83,8 @@ def chat():
                         iso_start,
                         end_date=iso_end,
                         description=description,
-                        set_reminder=True
+                        set_reminder=True,
+                        timezone_str=user_timezone(creds)
                     )
                     
                     # Format response
@@ -99,60 +111,26 @@ def chat():
         
         # Get credentials for API access
         creds = load_credentials(user_id)
-        model = GenerativeModel(os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash'))
         
         # Check for commands
         is_command = False
         command_type = None
         command_content = user_message
         
-        # Define command prefixes and their handlers
-        commands = {
-            "@add": "add_event",
-            "@remove": "remove_event",
-            "@list": "list_events",
-            "@help": "show_help",
-            "@check": "check_availability",
-            "@when": "check_availability",
-            "@suggest": "suggest_time"
-        }
-        
         # Check if message starts with any command prefix
-        for prefix, command in commands.items():
-            if user_message.lower().startswith(prefix.lower()):
-                is_command = True
-                command_type = command
-                command_content = user_message[len(prefix):].strip()
-                current_app.logger.info(f"Detected command: {command_type}, content: {command_content}")
-                break
+        detected = detect_command(user_message)
+        if detected:
+            is_command = True
+            command_type, command_content = detected
+            current_app.logger.info(f"Detected command: {command_type}, content: {command_content}")
         
         # Process commands
         if is_command:
             return process_command(command_type, command_content, creds, user_id)
         
         # Handle normal chat (not a command)
-        calendar_events = fetch_calendar_events(creds)
-        emails = fetch_emails(user_id)
-        relevant_data = emails if "@email" in user_message.lower() else calendar_events
-
-        prompt = f"""
-        You are an AI assistant for RunDown, a task management application. You have access to the following information:
-        
-        {f'**Relevant Data:**{relevant_data}' if relevant_data else ''}
-        
-        The user can use the following commands:
-        - @add [event details] - Add an event to calendar (e.g., "@add Meeting with John tomorrow at 3pm")
-        - @remove [event ID or description] - Remove an event from calendar
-        - @list - List upcoming events
-        - @help - Show available commands
-        
-        Refer to the above details and answer the upcoming questions. Prefer a concise answer.
-        If the user is asking about adding or removing events, suggest using the appropriate command.
-        
-        User Query: {user_message}
-        """
-
-        response = model.generate_content(prompt)
+        prompt = build_chat_prompt(user_message, creds, user_id)
+        response = generate_content(prompt)
         if not response or not response.text.strip():
             return jsonify({"error": "Empty response from AI model"}), 500
         return jsonify({"response": response.text.strip(), "command_detected": False})
@@ -161,6 +139,93 @@ def chat():
         current_app.logger.error(traceback.format_exc())
         return jsonify({"error": "Internal server error"}), 500
 
+# Command prefixes recognized at the start of a chat message, and the command each one runs
+COMMANDS = {
+    "@add": "add_event",
+    "@remove": "remove_event",
+    "@list": "list_events",
+    "@help": "show_help",
+    "@check": "check_availability",
+    "@when": "check_availability",
+    "@suggest": "suggest_time"
+}
+
+def detect_command(user_message):
+    """Return (command_type, command_content) if the message starts with a command prefix, else None"""
+    for prefix, command in COMMANDS.items():
+        if user_message.lower().startswith(prefix):
+            return command, user_message[len(prefix):].strip()
+    return None
+
+def build_chat_prompt(user_message, creds, user_id):
+    """Build the model prompt for a free-form (non-command) chat message"""
+    # Only the sources this message needs, fetched concurrently within CHAT_CONTEXT_DEADLINE
+    context = build_context(user_message, creds, user_id)
+    relevant_data = "\n    ".join(f"**Relevant Data ({label}):**{data}" for label, data in context)
+
+    return f"""
+    You are an AI assistant for RunDown, a task management application. You have access to the following information:
+    
+    {relevant_data}
+    
+    The user can use the following commands:
+    - @add [event details] - Add an event to calendar (e.g., "@add Meeting with John tomorrow at 3pm")
+    - @remove [event ID or description] - Remove an event from calendar
+    - @list - List upcoming events
+    - @help - Show available commands
+    
+    Refer to the above details and answer the upcoming questions. Prefer a concise answer.
+    If the user is asking about adding or removing events, suggest using the appropriate command.
+    
+    User Query: {user_message}
+    """
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@chat_bp.route('/chat/stream', methods=['POST'])
+@require_auth
+def chat_stream():
+    """Stream the answer to a chat message as Server-Sent Events ("token", then "done" or "error")"""
+    user_id = session.get('user_id')
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+    
+    # Commands and follow-ups are answered in one piece by /chat
+    if not user_message or data.get('follow_up') or detect_command(user_message):
+        return chat()
+    
+    try:
+        creds = load_credentials(user_id)
+        prompt = build_chat_prompt(user_message, creds, user_id)
+    except Exception as e:
+        current_app.logger.error(f"Chat stream error: {str(e)}")
+        current_app.logger.error(traceback.format_exc())
+        return jsonify({"error": "Internal server error"}), 500
+    
+    def generate():
+        received = False
+        try:
+            for text in stream_content(prompt):
+                received = True
+                yield sse_event("token", {"text": text})
+            if not received:
+                yield sse_event("error", {"error": "Empty response from AI model"})
+                return
+            yield sse_event("done", {})
+        except Exception as e:
+            current_app.logger.error(f"Chat stream error: {str(e)}")
+            current_app.logger.error(traceback.format_exc())
+            yield sse_event("error", {"error": "Internal server error"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        # Keep proxies from buffering the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 def process_command(command_type, command_content, creds, user_id):
     """Process a command from the chatbot"""
     try:
@@ -197,6 +262,8 @@ def add_event_command(command_content, creds):
             "command_detected": True
         })
     
+    now = user_now(creds)
+    
     # Use AI to extract event details
     prompt = f"""
     Extract event details from the following text: "{command_content}"
@@ -216,27 +283,26 @@ def add_event_command(command_content, creds):
     }}
     
     For dates:
+    - It is now {now.strftime('%A, %Y-%m-%d %H:%M')} in the user's timezone
+    - "Tonight" or "this evening" means today at 19:00 unless a time is given
+    - If a day is given without a time, pick a sensible time that is not earlier than now
     - If no date is specified, use tomorrow at 9am
-    - If a date is specified without a year, use the current year {datetime.now().year}
+    - If a date is specified without a year, use the current year {now.year}
     - If a date mentions a month after the current month with no year, assume the current year
     - If a date mentions a month before the current month with no year, assume next year
     - Always provide the full date in YYYY-MM-DD HH:MM format
     """
     
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        current_app.logger.info(f"AI response for date extraction: {response_text}")
-        
-        # Extract JSON from response if needed
-        if "```json" in response_text:
-            json_str = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            json_str = response_text.split("```")[1].strip()
+        # Simple commands are parsed locally; the model is only called when the parser is unsure
+        event_data = parse_event_locally(command_content, now)
+        if event_data:
+            current_app.logger.info(f"Parsed event details locally: {event_data}")
         else:
-            json_str = response_text
-            
-        event_data = json.loads(json_str)
+            response = generate_content(prompt)
+            response_text = response.text.strip()
+            current_app.logger.info(f"AI response for date extraction: {response_text}")
+            event_data = parse_json_response(response_text)
         
         title = event_data.get("title", "New Event")
         date_str = event_data.get("date")
@@ -249,7 +315,7 @@ def add_event_command(command_content, creds):
             event_dt = parser.parse(date_str)
             
             # Ensure the event is not defaulting to a future year if not explicitly specified
-            current_year = datetime.now().year
+            current_year = now.year
             
             # Check if the parsed date is in the future with a different year
             if event_dt.year != current_year:
@@ -261,7 +327,6 @@ def add_event_command(command_content, creds):
                     current_app.logger.info(f"Adjusted year to current year: {event_dt}")
                     
                     # If this makes the date in the past, and it's not today, assume it's for next year
-                    now = datetime.now()
                     if event_dt < now and event_dt.date() != now.date():
                         event_dt = event_dt.replace(year=current_year + 1)
                         current_app.logger.info(f"Date was in the past, adjusted to next year: {event_dt}")
@@ -271,7 +336,7 @@ def add_event_command(command_content, creds):
         except Exception as date_error:
             current_app.logger.error(f"Error parsing date: {date_error}, using default date")
             # Default to tomorrow 9am
-            event_dt = datetime.now() + timedelta(days=1)
+            event_dt = now + timedelta(days=1)
             event_dt = event_dt.replace(hour=9, minute=0, second=0, microsecond=0)
             current_app.logger.info(f"Using default date: {event_dt}")
         
@@ -305,7 +370,9 @@ def add_event_command(command_content, creds):
             event_dt.strftime("%Y-%m-%d %H:%M:%S"), 
             iso_date,
             description=description,
-            set_reminder=True
+            set_reminder=True,
+            timezone_str=user_timezone(creds),
+            source_id=email_id
         )
         
         # Format response
@@ -368,8 +435,8 @@ def remove_event_command(command_content, creds):
             # Not an ID, so search by title
             pass
         
-        # Search for events by title
-        events = fetch_calendar_events(creds)
+        # Search for events by title (all upcoming events in the local store)
+        events = fetch_calendar_events(creds, max_results=None)
         matching_events = []
         
         for event in events:
@@ -404,6 +471,8 @@ def remove_event_command(command_content, creds):
                 try:
                     from dateutil import parser
                     dt = parser.parse(start)
+                    if dt.tzinfo:
+                        dt = dt.astimezone(pytz.timezone(user_timezone(creds)))
                     formatted_date = dt.strftime("%A, %B %d at %I:%M %p")
                 except:
                     formatted_date = start
@@ -455,6 +524,8 @@ def list_events_command(creds):
             try:
                 from dateutil import parser
                 dt = parser.parse(start)
+                if dt.tzinfo:
+                    dt = dt.astimezone(pytz.timezone(user_timezone(creds)))
                 formatted_date = dt.strftime("%A, %B %d at %I:%M %p")
             except:
                 formatted_date = start
@@ -513,186 +584,190 @@ def show_help_command():
 @chat_bp.route('/addsuggestion', methods=['POST'])
 @require_auth
 def add_suggestion():
+    """
+    Suggest tasks from recent emails.
+
+    With {"async": true} the work runs as a background job: the response is
+    {"job_id", "status"} straight away and progress is read from
+    GET /addsuggestion/<job_id>. An unfinished or recent job for the same
+    time period is reused; pass {"refresh": true} to start over once it is done.
+    """
     user_id = session.get('user_id')
     try:
         data = request.get_json() or {}
         # Get the time period from the request (default to 7 days)
         time_period = int(data.get('time_period', 7))
         
-        creds = load_credentials(user_id)
-        # Pass the time period to fetch_emails
-        emails = fetch_emails(user_id, days=time_period)
-        
-        # Fetch existing calendar events to check for duplicates
-        calendar_events = fetch_calendar_events(creds)
-        existing_event_titles = [event.get('summary', '').lower() for event in calendar_events]
-        existing_subjects = {}
-        existing_email_ids = set()
-        
-        # Build a map of subjects that already have events to avoid duplicates
-        for event in calendar_events:
-            # Extract subject from event description if available
-            description = event.get('description', '')
-            # Extract email ID if it exists in the description
-            if 'Email ID:' in description:
-                email_id_line = [line for line in description.split('\n') if 'Email ID:' in line]
-                if email_id_line:
-                    email_id = email_id_line[0].replace('Email ID:', '').strip()
-                    existing_email_ids.add(email_id)
-            
-            if 'Subject:' in description:
-                subject_line = [line for line in description.split('\n') if 'Subject:' in line]
-                if subject_line:
-                    subject = subject_line[0].replace('Subject:', '').strip()
-                    existing_subjects[subject.lower()] = True
-        
-        # Get user preferences for filtering
-        user_preferences = UserPreferences.load_preferences(user_id)
-        user_interests = user_preferences.get('interests', [])
-        filtering_enabled = user_preferences.get('enabled', True)
-        
-        filtered_emails = []
-        suggestions = []
-        
-        # Only apply filtering if user has preferences and filtering is enabled
-        if filtering_enabled and user_interests:
-            current_app.logger.info(f"Filtering emails based on user interests: {user_interests}")
-            
-            # Filter emails based on user interests
-            for email in emails:
-                email_content = f"{email.get('subject', '')} {email.get('content', '')}".lower()
-                for interest in user_interests:
-                    if interest.lower() in email_content:
-                        filtered_emails.append(email)
-                        break
-            
-            current_app.logger.info(f"Filtered {len(filtered_emails)} emails from {len(emails)} total")
-        else:
-            # No filtering needed
-            filtered_emails = emails
-        
-        # Process emails (filtered or all)
-        for email in filtered_emails:
-            email_id = email.get('id', '')
-            email_subject = email.get('subject', 'No Subject')
-            email_content = email.get('content', '')
-            
-            # Skip if the email subject is already in calendar events or already processed
-            if email_subject.lower() in existing_subjects:
-                current_app.logger.info(f"Skipping already processed email: {email_subject}")
-                continue
-                
-            # Skip if the email title exactly matches an existing event
-            if any(email_subject.lower() == title for title in existing_event_titles):
-                current_app.logger.info(f"Skipping email with title already in calendar: {email_subject}")
-                continue
-            
-            prompt = f"""
-            **Email Subject:** {email_subject}
-            **Email Content:** {email_content}
-            
-            Extract the following information from this email:
-            1. A task description (what needs to be done or attended)
-            2. When this task/event is happening (date and time in YYYY-MM-DD HH:MM format)
-            3. Where it's happening (location)
-            4. Is this time-sensitive? (yes/no)
-            
-            Format your response as JSON:
-            {{
-                "task": "task description",
-                "event_date": "YYYY-MM-DD HH:MM or none if not found",
-                "location": "location if mentioned or none",
-                "is_time_sensitive": true/false
-            }}
-            
-            If there is no clear task or this is just an informational email, respond with:
-            {{
-                "task": "FYI: brief summary of what this email is about",
-                "event_date": "none",
-                "location": "none",
-                "is_time_sensitive": false
-            }}
-            """
-            
-            response = model.generate_content(prompt)
-            
-            if response and response.text.strip():
-                try:
-                    # Extract JSON from response
-                    response_text = response.text.strip()
-                    if "```json" in response_text:
-                        json_str = response_text.split("```json")[1].split("```")[0].strip()
-                    elif "```" in response_text:
-                        json_str = response_text.split("```")[1].strip()
-                    else:
-                        json_str = response_text
-                    
-                    suggestion_data = json.loads(json_str)
-                    
-                    # Prepare formatted response
-                    task_text = suggestion_data.get('task', '')
-                    
-                    # Skip if the task is "FYI" or doesn't seem like an actionable task
-                    if task_text.startswith("FYI:") or not task_text:
-                        current_app.logger.info(f"Skipping non-actionable task: {task_text}")
-                        continue
-                        
-                    # Skip if the task exactly matches an existing event title
-                    if any(task_text.lower() == title for title in existing_event_titles):
-                        current_app.logger.info(f"Skipping task already in calendar: {task_text}")
-                        continue
-                    
-                    # Get the event date - look for event_date first (new format) then deadline (old format)
-                    event_date = suggestion_data.get('event_date', suggestion_data.get('deadline', 'none'))
-                    location = suggestion_data.get('location', 'none')
-                    
-                    formatted_deadline = None
-                    if event_date and event_date.lower() != 'none':
-                        try:
-                            # First try strict format
-                            dt = datetime.strptime(event_date, "%Y-%m-%d %H:%M")
-                            formatted_deadline = dt.strftime("%b %d, %Y at %I:%M %p")
-                        except ValueError:
-                            try:
-                                # Try with dateutil parser as fallback
-                                from dateutil import parser
-                                dt = parser.parse(event_date)
-                                formatted_deadline = dt.strftime("%b %d, %Y at %I:%M %p")
-                            except:
-                                # Just use as is if parsing fails
-                                formatted_deadline = event_date
-                    
-                    # Add to suggestions
-                    suggestions.append({
-                        "text": task_text,
-                        "deadline": formatted_deadline,
-                        "email_id": email_id,
-                        "email_subject": email_subject,
-                        "location": location if location and location.lower() != 'none' else None,
-                        "event_date": event_date if event_date and event_date.lower() != 'none' else None,
-                        "is_time_sensitive": suggestion_data.get('is_time_sensitive', False)
-                    })
-                    
-                except Exception as json_error:
-                    # Fallback if JSON parsing fails
-                    current_app.logger.error(f"Error parsing AI response: {json_error}")
-                    current_app.logger.error(traceback.format_exc())
-                    suggestions.append({
-                        "text": response.text.strip(),
-                        "email_id": email_id,
-                        "email_subject": email_subject
-                    })
-        
-        # Sort suggestions by time sensitivity
-        suggestions.sort(key=lambda x: x.get('is_time_sensitive', False), reverse=True)
+        if data.get('async'):
+            job, created = start_job(
+                user_id, f"suggestions:{time_period}", run_suggestion_job, user_id, time_period,
+                restart=bool(data.get('refresh'))
+            )
+            current_app.logger.info(f"{'Started' if created else 'Reusing'} suggestion job {job.id} for {time_period} days")
+            return jsonify({"job_id": job.id, "status": job.status}), 202
         
-        current_app.logger.info(f"Generated {len(suggestions)} suggestions")
+        # Whatever finished by SUGGESTION_DEADLINE is returned
+        suggestions = collect_suggestions(user_id, time_period, deadline=SUGGESTION_DEADLINE)
         return jsonify({"suggestions": suggestions})
     except Exception as e:
         current_app.logger.error(f"Add suggestion error: {str(e)}")
         current_app.logger.error(traceback.format_exc())
         return jsonify({"error": "Internal server error"}), 500
 
+@chat_bp.route('/addsuggestion/<job_id>', methods=['GET'])
+@require_auth
+def suggestion_job_status(job_id):
+    """Progress of a suggestion job plus the suggestions produced so far"""
+    job = get_job(job_id, session.get('user_id'))
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    state = job.to_dict()
+    return jsonify({
+        "job_id": state["job_id"],
+        "status": state["status"],
+        "progress": state["progress"],
+        "suggestions": state["result"] or [],
+        "error": "Internal server error" if state["error"] else None
+    })
+
+def run_suggestion_job(job, user_id, time_period):
+    """Background body of a suggestion job; publishes partial suggestions as batches finish"""
+    def on_progress(stage, completed, total, suggestions):
+        job.update(result=suggestions, stage=stage, completed=completed, total=total)
+    return collect_suggestions(user_id, time_period, on_progress=on_progress)
+
+def collect_suggestions(user_id, time_period, deadline=None, on_progress=None):
+    """
+    Build task suggestions from the user's emails of the last time_period days.
+
+    Emails that already have a calendar event are skipped. Extraction runs
+    in parallel and stops waiting after deadline seconds (if given).
+    on_progress(stage, completed, total, suggestions) is called as work
+    advances, with the suggestions found so far in their final order.
+    """
+    def report(stage, completed=0, total=0, suggestions=None):
+        if on_progress:
+            on_progress(stage, completed, total, suggestions if suggestions is not None else [])
+    
+    report("fetching")
+    creds = load_credentials(user_id)
+    # Pass the time period to fetch_emails
+    emails = fetch_emails(user_id, days=time_period)
+    
+    # Fingerprints (source email IDs and title hashes) of every event already in the calendar
+    existing_fingerprints = get_fingerprints(creds)
+    
+    # Get user preferences for filtering
+    user_preferences = UserPreferences.load_preferences(user_id)
+    user_interests = user_preferences.get('interests', [])
+    filtering_enabled = user_preferences.get('enabled', True)
+    
+    filtered_emails = []
+    
+    # Only apply filtering if user has preferences and filtering is enabled
+    if filtering_enabled and user_interests:
+        current_app.logger.info(f"Filtering emails based on user interests: {user_interests}")
+        
+        # Filter emails based on user interests
+        interest_matcher = get_interest_matcher(user_id, user_interests)
+        for email in emails:
+            if interest_matcher.search(f"{email.get('subject', '')} {email.get('content', '')}"):
+                filtered_emails.append(email)
+        
+        current_app.logger.info(f"Filtered {len(filtered_emails)} emails from {len(emails)} total")
+    else:
+        # No filtering needed
+        filtered_emails = emails
+    
+    # Skip emails that already have a matching calendar event
+    candidates = []
+    for email in filtered_emails:
+        if 'error' in email:
+            continue
+        email_subject = email.get('subject', 'No Subject')
+        
+        # Skip if an event was already created from this email
+        if source_fingerprint(email.get('id')) in existing_fingerprints:
+            current_app.logger.info(f"Skipping already processed email: {email_subject}")
+            continue
+            
+        # Skip if the email title matches an existing event
+        if title_fingerprint(email_subject) in existing_fingerprints:
+            current_app.logger.info(f"Skipping email with title already in calendar: {email_subject}")
+            continue
+        candidates.append(email)
+    
+    # email id -> built suggestion (None when the email had no actionable task)
+    built = {}
+    
+    def ordered_suggestions():
+        # Candidate order, then time-sensitive suggestions first (the sort is stable)
+        suggestions = [built[str(email.get('id'))] for email in candidates if built.get(str(email.get('id')))]
+        suggestions.sort(key=lambda x: x.get('is_time_sensitive', False), reverse=True)
+        return suggestions
+    
+    candidates_by_id = {str(email.get('id')): email for email in candidates}
+    
+    def on_batch(batch_results):
+        for email_id, suggestion_data in batch_results.items():
+            if email_id in candidates_by_id:
+                built[email_id] = build_suggestion(candidates_by_id[email_id], suggestion_data, existing_fingerprints)
+        report("extracting", len(built), len(candidates), ordered_suggestions())
+    
+    report("extracting", 0, len(candidates))
+    # Extract tasks with batched prompts run in parallel; emails seen before are served from the cache
+    extract_from_emails('suggestion', candidates, deadline=deadline, on_batch=on_batch,
+                        user_id=user_id, timezone_str=get_user_timezone(creds, user_id) if candidates else None)
+    
+    suggestions = ordered_suggestions()
+    report("done", len(built), len(candidates), suggestions)
+    current_app.logger.info(f"Generated {len(suggestions)} suggestions")
+    return suggestions
+
+def build_suggestion(email, suggestion_data, existing_fingerprints):
+    """Turn an extracted task into a suggestion dict, or None if it should be skipped."""
+    task_text = suggestion_data.get('task', '')
+    
+    # Skip if the task is "FYI" or doesn't seem like an actionable task
+    if task_text.startswith("FYI:") or not task_text:
+        current_app.logger.info(f"Skipping non-actionable task: {task_text}")
+        return None
+        
+    # Skip if the task matches an existing event title
+    if title_fingerprint(task_text) in existing_fingerprints:
+        current_app.logger.info(f"Skipping task already in calendar: {task_text}")
+        return None
+    
+    # Get the event date - look for event_date first (new format) then deadline (old format)
+    event_date = suggestion_data.get('event_date', suggestion_data.get('deadline', 'none'))
+    location = suggestion_data.get('location', 'none')
+    
+    formatted_deadline = None
+    if event_date and event_date.lower() != 'none':
+        try:
+            # First try strict format
+            dt = datetime.strptime(event_date, "%Y-%m-%d %H:%M")
+            formatted_deadline = dt.strftime("%b %d, %Y at %I:%M %p")
+        except ValueError:
+            try:
+                # Try with dateutil parser as fallback
+                from dateutil import parser
+                dt = parser.parse(event_date)
+                formatted_deadline = dt.strftime("%b %d, %Y at %I:%M %p")
+            except:
+                # Just use as is if parsing fails
+                formatted_deadline = event_date
+    
+    return {
+        "text": task_text,
+        "deadline": formatted_deadline,
+        "email_id": email.get('id', ''),
+        "email_subject": email.get('subject', 'No Subject'),
+        "location": location if location and location.lower() != 'none' else None,
+        "event_date": event_date if event_date and event_date.lower() != 'none' else None,
+        "is_time_sensitive": suggestion_data.get('is_time_sensitive', False)
+    }
+
 @chat_bp.route('/addtask', methods=['POST'])
 @require_auth
 def add_task():
@@ -700,6 +775,7 @@ def add_task():
     user_id = session.get('user_id')
     try:
         creds = load_credentials(user_id)
+        now = user_now(creds)
         
         # Check if the content type is JSON
         is_json = request.headers.get('Content-Type') == 'application/json'
@@ -711,6 +787,8 @@ def add_task():
             # Get the original event_date if available
             original_event_date = data.get('event_date')
             display_date = data.get('display_date')
+            # Gmail message the suggestion came from, used as the event's fingerprint
+            email_id = data.get('email_id')
             
             print(f"Received task with original_event_date: {original_event_date}, display_date: {display_date}")
         else:
@@ -718,6 +796,7 @@ def add_task():
             task_desc = request.data.decode('utf-8')
             original_event_date = None
             display_date = None
+            email_id = None
         
         # Use the original event date if available, otherwise ask AI to extract
         if original_event_date and original_event_date.lower() != 'none':
@@ -729,11 +808,10 @@ def add_task():
                 print(f"Successfully parsed original event date: {original_event_date} -> {dt}")
                 
                 # Check if the year wasn't explicitly specified
-                current_year = datetime.now().year
+                current_year = now.year
                 if dt.year != current_year and str(dt.year) not in original_event_date:
                     dt = dt.replace(year=current_year)
                     # If this makes the date in the past (and it's not today), use next year
-                    now = datetime.now()
                     if dt < now and dt.date() != now.date():
                         dt = dt.replace(year=current_year + 1)
                         print(f"Adjusted to next year: {dt}")
@@ -755,7 +833,9 @@ def add_task():
                     dt.strftime("%Y-%m-%d %H:%M:%S"), 
                     iso_date,
                     description=description,
-                    set_reminder=True
+                    set_reminder=True,
+                    timezone_str=user_timezone(creds),
+                    source_id=email_id
                 )
                 
                 # Format deadline for display
@@ -793,29 +873,29 @@ def add_task():
         }}
         
         For dates:
+        - It is now {now.strftime('%A, %Y-%m-%d %H:%M')} in the user's timezone
+        - "Tonight" or "this evening" means today at 19:00 unless a time is given
+        - If a day is given without a time, pick a sensible time that is not earlier than now
         - If no date is specifically mentioned, use tomorrow at 9am
-        - If a date is specified without a year, use the current year {datetime.now().year}
+        - If a date is specified without a year, use the current year {now.year}
         - If a date mentions a month after the current month with no year, assume the current year
         - If a date mentions a month before the current month with no year, assume next year
         - Always provide the full date in YYYY-MM-DD HH:MM format
         """
         
-        response = model.generate_content(prompt)
+        # Simple tasks are parsed locally; the model is only called when the parser is unsure
+        task_data = parse_event_locally(task_desc, now)
+        if task_data is None:
+            response = generate_content(prompt)
         
         # Parse the response
         try:
-            response_text = response.text.strip()
-            print(f"AI response: {response_text}")
-            
-            # Extract JSON from response if needed
-            if "```json" in response_text:
-                json_str = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                json_str = response_text.split("```")[1].strip()
+            if task_data is None:
+                response_text = response.text.strip()
+                print(f"AI response: {response_text}")
+                task_data = parse_json_response(response_text)
             else:
-                json_str = response_text
-                
-            task_data = json.loads(json_str)
+                print(f"Parsed task locally: {task_data}")
             title = task_data.get("title", task_desc)
             location = task_data.get("location")
             details = task_data.get("details")
@@ -829,11 +909,10 @@ def add_task():
                     dt = parser.parse(date_str)
                     
                     # Check if the year wasn't explicitly specified
-                    current_year = datetime.now().year
+                    current_year = now.year
                     if dt.year != current_year and str(dt.year) not in date_str:
                         dt = dt.replace(year=current_year)
                         # If this makes the date in the past (and it's not today), use next year
-                        now = datetime.now()
                         if dt < now and dt.date() != now.date():
                             dt = dt.replace(year=current_year + 1)
                             print(f"Adjusted to next year: {dt}")
@@ -843,13 +922,13 @@ def add_task():
                     print(f"Parsed date from AI: {date_str} -> {dt}")
                 else:
                     # Use tomorrow at 9am
-                    dt = datetime.now() + timedelta(days=1)
+                    dt = now + timedelta(days=1)
                     dt = dt.replace(hour=9, minute=0, second=0, microsecond=0)
                     print(f"Using default tomorrow at 9am: {dt}")
             except Exception as e:
                 print(f"Error parsing date from AI: {e}")
                 # Fallback to tomorrow at 9am
-                dt = datetime.now() + timedelta(days=1)
+                dt = now + timedelta(days=1)
                 dt = dt.replace(hour=9, minute=0, second=0, microsecond=0)
                 print(f"Using fallback tomorrow at 9am: {dt}")
             
@@ -870,7 +949,9 @@ def add_task():
                 dt.strftime("%Y-%m-%d %H:%M:%S"), 
                 iso_date,
                 description=description,
-                set_reminder=True
+                set_reminder=True,
+                timezone_str=user_timezone(creds),
+                source_id=email_id
             )
             
             # Format deadline for display
@@ -892,85 +973,32 @@ def add_task():
         current_app.logger.error(traceback.format_exc())
         return jsonify({"error": "Internal server error"}), 500
 
-def find_free_slots(events, date_to_check, timezone="America/New_York"):
+# Longest range answered by a single @check command
+MAX_AVAILABILITY_DAYS = 31
+
+def find_free_slots(busy, date_to_check, timezone=DEFAULT_TIMEZONE):
     """
     Find free time slots on a given day
     
     Args:
-        events: List of calendar events
+        busy: List of busy (start, end) intervals, as returned by fetch_busy_intervals
         date_to_check: Date to check for free time slots (datetime.date object)
         timezone: Timezone to use for calculations
     
     Returns:
-        List of free time slots as (start, end) tuples
+        List of free time slots as (start, end) tuples and the day's busy
+        periods as (start, end, "Busy") tuples
     """
-    # Set up the time zone
     tz = pytz.timezone(timezone)
-    
-    # Define the start and end of the working day (9 AM to 8 PM)
-    work_start_time = time(9, 0)  # 9 AM
-    work_end_time = time(20, 0)   # 8 PM
-    
-    # Create datetime objects for the start and end of the working day
-    day_start = datetime.combine(date_to_check, work_start_time)
-    day_start = tz.localize(day_start)
-    day_end = datetime.combine(date_to_check, work_end_time)
-    day_end = tz.localize(day_end)
-    
-    # Filter events that fall on the specified date
-    day_events = []
-    for event in events:
-        # Parse event start and end times
-        event_start = event.get('start', {}).get('dateTime')
-        event_end = event.get('end', {}).get('dateTime')
-        
-        if not event_start or not event_end:
-            continue
-            
-        # Convert to datetime objects
-        try:
-            event_start_dt = datetime.fromisoformat(event_start.replace('Z', '+00:00'))
-            event_end_dt = datetime.fromisoformat(event_end.replace('Z', '+00:00'))
-            
-            # Convert to target timezone
-            event_start_dt = event_start_dt.astimezone(tz)
-            event_end_dt = event_end_dt.astimezone(tz)
-            
-            # Check if the event falls on the target date
-            if event_start_dt.date() == date_to_check or event_end_dt.date() == date_to_check:
-                # Clip events to the working day if needed
-                if event_start_dt.date() < date_to_check:
-                    event_start_dt = day_start
-                if event_end_dt.date() > date_to_check:
-                    event_end_dt = day_end
-                    
-                day_events.append((event_start_dt, event_end_dt, event.get('summary', 'No Title')))
-        except Exception as e:
-            current_app.logger.error(f"Error parsing event date: {e}")
-            continue
-    
-    # Sort events by start time
-    day_events.sort(key=lambda x: x[0])
-    
-    # Find free time slots
-    free_slots = []
-    current_time = day_start
-    
-    for start, end, _ in day_events:
-        # If there's a gap between current_time and the next event's start
-        if current_time < start:
-            # Only add slots that are at least 30 minutes
-            if (start - current_time).total_seconds() >= 30 * 60:
-                free_slots.append((current_time, start))
-                
-        # Update current time to the end of this event
-        current_time = max(current_time, end)
-    
-    # Check for free time after the last event until end of day
-    if current_time < day_end:
-        free_slots.append((current_time, day_end))
-    
-    return free_slots, day_events
+    index = AvailabilityIndex.from_intervals(busy)
+    free_slots = index.free_slots(date_to_check, date_to_check, tz)[date_to_check]
+    return free_slots, index.booked(date_to_check, tz)
+
+def day_window(first_date, last_date=None):
+    """Return a UTC (time_min, time_max) window that covers the given days in any timezone"""
+    day_start = pytz.utc.localize(datetime.combine(first_date, time(0, 0)))
+    day_end = pytz.utc.localize(datetime.combine(last_date or first_date, time(0, 0)))
+    return day_start - timedelta(days=1), day_end + timedelta(days=2)
 
 def format_time_slot(slot):
     """Format a time slot for display"""
@@ -978,12 +1006,46 @@ def format_time_slot(slot):
     # Format as "10:00 AM - 11:30 AM"
     return f"{start.strftime('%I:%M %p')} - {end.strftime('%I:%M %p')}"
 
-def parse_date_with_ai(date_text, model):
-    """Use AI to parse a date string into a datetime object"""
+def parse_event_locally(text, now=None):
+    """
+    Read an event title and date/time from text without calling the model.
+
+    Relative dates are resolved against now (the user's local time). Returns
+    a dict shaped like the model's JSON ("title", "date", "location",
+    "details"), or None when the local parser is not confident, found no
+    clock time, would put the event in the past, or the title may still
+    contain a location that the model should extract.
+    """
+    parsed = parse_temporal(text, now)
+    if not parsed or parsed.confidence != HIGH or not parsed.remainder:
+        return None
+    # Without a clock time ("dinner tonight", "call mom today") let the model pick a sensible hour
+    if parsed.start_time is None:
+        return None
+    # "at"/"in" left over usually introduce a location ("lunch at Cafe Rio")
+    if re.search(r'\b(?:at|in)\b|@', parsed.remainder, re.IGNORECASE):
+        return None
+    event_dt = datetime.combine(parsed.date, parsed.start_time)
+    if now is not None and event_dt < now:
+        return None
+    return {
+        "title": parsed.remainder,
+        "date": event_dt.strftime("%Y-%m-%d %H:%M"),
+        "location": None,
+        "details": None
+    }
+
+def parse_date_with_ai(date_text, now=None):
+    """Parse a date string into a date relative to now, using the model only for expressions the local parser can't read"""
+    now = now or datetime.now()
+    parsed = parse_temporal(date_text, now)
+    if parsed and parsed.confidence == HIGH:
+        return parsed.date
+    
     prompt = f"""
     Parse the following date/time reference into a specific date: "{date_text}"
     
-    Today is {datetime.now().strftime('%A, %B %d, %Y')}.
+    Today is {now.strftime('%A, %B %d, %Y')}.
     If no specific date is mentioned, assume today.
     If a day of week is mentioned (e.g., "Monday"), use the upcoming one.
     
@@ -991,7 +1053,7 @@ def parse_date_with_ai(date_text, model):
     """
     
     try:
-        response = model.generate_content(prompt)
+        response = generate_content(prompt)
         date_str = response.text.strip()
         
         # Extract just the date if there's additional text
@@ -1006,7 +1068,7 @@ def parse_date_with_ai(date_text, model):
     except Exception as e:
         current_app.logger.error(f"Error parsing date with AI: {e}")
         # Return today's date as fallback
-        return datetime.now().date()
+        return now.date()
 
 def check_availability_command(command_content, creds):
     """Process availability check command and return free time slots"""
@@ -1017,31 +1079,37 @@ def check_availability_command(command_content, creds):
         })
     
     try:
-        # Initialize the model for date parsing
-        model = GenerativeModel(os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash'))
+        # Ranges such as "this week" or "next 14 days" get a multi-day answer
+        timezone = user_timezone(creds)
+        now = user_now(creds)
+        parsed = parse_temporal(command_content, now)
+        if parsed and parsed.confidence == HIGH and parsed.end_date > parsed.date:
+            return check_availability_range(parsed.date, parsed.end_date, creds, timezone)
         
         # Parse the date using AI
-        date_to_check = parse_date_with_ai(command_content, model)
+        date_to_check = parse_date_with_ai(command_content, now)
         
-        # Fetch calendar events
-        events = fetch_calendar_events(creds)
+        # Fetch busy intervals around the requested day
+        busy = fetch_busy_intervals(creds, *day_window(date_to_check))
         
-        # Get free time slots and booked events
-        free_slots, booked_events = find_free_slots(events, date_to_check)
+        # Get free time slots and booked periods
+        free_slots, booked_events = find_free_slots(busy, date_to_check, timezone)
         
         # Format the response
         formatted_date = date_to_check.strftime("%A, %B %d, %Y")
         
         # Format the response message
         if not booked_events:
-            response = f"### Availability for {formatted_date}\n\nYou have no events scheduled for this day. You're completely free from 9:00 AM to 8:00 PM."
+            work_start = DEFAULT_WORK_START.strftime('%I:%M %p').lstrip('0')
+            work_end = DEFAULT_WORK_END.strftime('%I:%M %p').lstrip('0')
+            response = f"### Availability for {formatted_date}\n\nYou have no events scheduled for this day. You're completely free from {work_start} to {work_end}."
         else:
             response = f"### Availability for {formatted_date}\n\n"
             
-            # Add booked events
-            response += "**Booked Events:**\n"
-            for start, end, summary in booked_events:
-                response += f"- {summary}: {start.strftime('%I:%M %p')} - {end.strftime('%I:%M %p')}\n"
+            # Add booked periods
+            response += "**Busy:**\n"
+            for start, end, _ in booked_events:
+                response += f"- {start.strftime('%I:%M %p')} - {end.strftime('%I:%M %p')}\n"
             
             # Add free slots
             response += "\n**Free Time Slots:**\n"
@@ -1051,15 +1119,6 @@ def check_availability_command(command_content, creds):
             else:
                 response += "You have no free time slots available on this day."
         
-        # Store the free slots in session for possible follow-up
-        session['free_slots'] = [
-            {
-                'start': slot[0].isoformat(),
-                'end': slot[1].isoformat()
-            } for slot in free_slots
-        ]
-        session['availability_date'] = date_to_check.isoformat()
-        
         return jsonify({
             "response": response,
             "command_detected": True,
@@ -1074,6 +1133,30 @@ def check_availability_command(command_content, creds):
             "command_detected": True
         })
 
+def check_availability_range(start_date, end_date, creds, timezone=DEFAULT_TIMEZONE):
+    """Report free time slots for every day in a date range"""
+    end_date = min(end_date, start_date + timedelta(days=MAX_AVAILABILITY_DAYS - 1))
+    tz = pytz.timezone(timezone)
+    
+    # One freeBusy query and one index for the whole range
+    busy = fetch_busy_intervals(creds, *day_window(start_date, end_date))
+    slots_by_day = AvailabilityIndex.from_intervals(busy).free_slots(start_date, end_date, tz)
+    
+    response = f"### Availability for {start_date.strftime('%A, %B %d')} - {end_date.strftime('%A, %B %d, %Y')}\n\n"
+    for day, free_slots in slots_by_day.items():
+        response += f"**{day.strftime('%A, %B %d')}:** "
+        if free_slots:
+            response += ", ".join(format_time_slot(slot) for slot in free_slots) + "\n"
+        else:
+            response += "No free time slots\n"
+    
+    return jsonify({
+        "response": response,
+        "command_detected": True,
+        "markdown": True,
+        "free_slots": any(slots_by_day.values())
+    })
+
 def suggest_time_command(command_content, creds):
     """Suggest a free time slot for an event based on calendar availability"""
     if not command_content:
@@ -1083,9 +1166,6 @@ def suggest_time_command(command_content, creds):
         })
     
     try:
-        # Initialize the model
-        model = GenerativeModel(os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash'))
-        
         # Extract event details and target date
         prompt = f"""
         Extract event information from this request: "{command_content}"
@@ -1105,80 +1185,42 @@ def suggest_time_command(command_content, creds):
         }}
         """
         
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response if needed
-        if "```json" in response_text:
-            json_str = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            json_str = response_text.split("```")[1].strip()
-        else:
-            json_str = response_text
-            
-        event_data = json.loads(json_str)
+        response = generate_content(prompt)
+        event_data = parse_json_response(response.text)
         
         # Parse the date
-        target_date = parse_date_with_ai(event_data.get("target_date", "today"), model)
+        tz = pytz.timezone(user_timezone(creds))
+        target_date = parse_date_with_ai(event_data.get("target_date", "today"), user_now(creds))
         
         # Get event title and duration
         title = event_data.get("title", "New Event")
         duration = int(event_data.get("duration", 60))  # in minutes
         preference = event_data.get("preference")
         
-        # Fetch calendar events
-        events = fetch_calendar_events(creds)
-        
-        # Find free slots
-        free_slots, _ = find_free_slots(events, target_date)
-        
-        # Filter slots based on duration and preference
-        suitable_slots = []
-        for start, end in free_slots:
-            slot_duration = (end - start).total_seconds() / 60
-            
-            # Check if the slot is long enough
-            if slot_duration >= duration:
-                # Create potential slots within this free period
-                potential_starts = []
-                current = start
-                while (current + timedelta(minutes=duration)) <= end:
-                    potential_starts.append(current)
-                    current += timedelta(minutes=30)  # 30-minute increments
-                
-                # Add all potential start times to suitable slots
-                for potential_start in potential_starts:
-                    slot_end = potential_start + timedelta(minutes=duration)
-                    suitable_slots.append((potential_start, slot_end))
-        
-        # Apply time preference if specified
-        if preference and suitable_slots:
-            filtered_slots = []
-            
-            if preference.lower() in ["morning", "am", "early"]:
-                # Morning: 9 AM - 12 PM
-                filtered_slots = [s for s in suitable_slots if s[0].hour < 12]
-            elif preference.lower() in ["afternoon", "noon", "lunch"]:
-                # Afternoon: 12 PM - 5 PM
-                filtered_slots = [s for s in suitable_slots if 12 <= s[0].hour < 17]
-            elif preference.lower() in ["evening", "night", "pm", "late"]:
-                # Evening: 5 PM - 8 PM
-                filtered_slots = [s for s in suitable_slots if s[0].hour >= 17]
-                
-            if filtered_slots:
-                suitable_slots = filtered_slots
+        # Search the target day and the following days, best candidates first
+        last_date = target_date + timedelta(days=max(SUGGEST_SEARCH_DAYS, 1) - 1)
+        busy = fetch_busy_intervals(creds, *day_window(target_date, last_date))
+        index = AvailabilityIndex.from_intervals(busy)
+        ranked_slots = index.rank_slots(
+            target_date, last_date, tz, duration,
+            preference=preference,
+            limit=SUGGEST_ALTERNATIVES + 1,
+            not_before=datetime.now(tz)
+        )
         
         # No suitable slots found
-        if not suitable_slots:
+        if not ranked_slots:
             formatted_date = target_date.strftime("%A, %B %d, %Y")
+            if last_date > target_date:
+                formatted_date += f" or the {(last_date - target_date).days} days after"
             return jsonify({
                 "response": f"I couldn't find a suitable time for a {duration}-minute '{title}' on {formatted_date}. Would you like to check a different day?",
                 "command_detected": True,
                 "ask_followup": False
             })
             
-        # Select the best slot (first available, or based on preference)
-        best_slot = suitable_slots[0]
+        best_slot = ranked_slots[0]
+        target_date = best_slot[0].date()
         
         # Format the suggestion
         start_time = best_slot[0].strftime("%I:%M %p")
@@ -1186,14 +1228,26 @@ def suggest_time_command(command_content, creds):
         formatted_date = target_date.strftime("%A, %B %d, %Y")
         
         # Store event info for follow-up
-        session['suggested_event'] = {
+        conversation.remember(session.get('user_id'), suggested_event={
             'title': title,
             'start': best_slot[0].isoformat(),
             'end': best_slot[1].isoformat(),
             'date': target_date.isoformat()
-        }
+        })
         
-        response = f"### Time Suggestion\n\nI suggest scheduling **{title}** on **{formatted_date}** from **{start_time}** to **{end_time}**.\n\nWould you like me to add this to your calendar?"
+        response = f"### Time Suggestion\n\nI suggest scheduling **{title}** on **{formatted_date}** from **{start_time}** to **{end_time}**.\n\n"
+        alternatives = []
+        if len(ranked_slots) > 1:
+            response += "Other options:\n"
+            for alt_start, alt_end in ranked_slots[1:]:
+                response += f"- {alt_start.strftime('%A, %B %d')}: {format_time_slot((alt_start, alt_end))}\n"
+                alternatives.append({
+                    "date": alt_start.strftime("%A, %B %d, %Y"),
+                    "start_time": alt_start.strftime("%I:%M %p"),
+                    "end_time": alt_end.strftime("%I:%M %p")
+                })
+            response += "\n"
+        response += "Would you like me to add this to your calendar?"
         
         return jsonify({
             "response": response,
@@ -1205,7 +1259,8 @@ def suggest_time_command(command_content, creds):
                 "date": formatted_date,
                 "start_time": start_time,
                 "end_time": end_time
-            }
+            },
+            "alternatives": alternatives
         })
         
     except Exception as e:
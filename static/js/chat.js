@@ -287,7 +287,7 @@ function addMessage(message, isUser = true, isMarkdown = false) {
   const chatMessages = document.getElementById('chat-messages');
   if (!chatMessages) {
     console.error("Chat messages container not found");
-    return;
+    return null;
   }
   
   // Check if user was already at the bottom before adding message
@@ -302,6 +302,93 @@ function addMessage(message, isUser = true, isMarkdown = false) {
       chatMessages.scrollTop = chatMessages.scrollHeight;
     }, 10);
   }
+  
+  return div;
+}
+
+// Command prefixes handled by /chat in one piece (see COMMANDS in chat_routes.py)
+const COMMAND_PREFIXES = ['@add', '@remove', '@list', '@help', '@check', '@when', '@suggest'];
+
+function isCommandMessage(message) {
+  const lowered = message.toLowerCase();
+  return COMMAND_PREFIXES.some(prefix => lowered.startsWith(prefix));
+}
+
+// Stream a chat answer from /chat/stream (Server-Sent Events), rendering tokens as they arrive.
+// Returns the parsed JSON instead if the server answered with a regular JSON response.
+async function streamChatResponse(requestData, loadingMessage) {
+  const response = await fetch("/chat/stream", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      'X-Requested-With': 'XMLHttpRequest'
+    },
+    body: JSON.stringify(requestData),
+    credentials: "include"
+  });
+  
+  const contentType = response.headers.get('Content-Type') || '';
+  if (!response.ok || !contentType.includes('text/event-stream') || !response.body) {
+    return handleApiResponse(response);
+  }
+  
+  const chatMessages = document.getElementById('chat-messages');
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let text = '';
+  let bubble = null;
+  
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let eventName = 'message';
+      let payload = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        else if (line.startsWith('data:')) payload += line.slice(5).trim();
+      });
+      const eventData = payload ? JSON.parse(payload) : {};
+      
+      if (eventName === 'error') {
+        throw new Error(eventData.error || 'Streaming failed');
+      }
+      if (eventName === 'token') {
+        // Replace the loading indicator with the answer on the first token
+        if (!bubble) {
+          if (loadingMessage) loadingMessage.remove();
+          bubble = addMessage('', false);
+        }
+        const wasAtBottom = chatMessages.scrollHeight - chatMessages.clientHeight <= chatMessages.scrollTop + 50;
+        text += eventData.text;
+        bubble.textContent = text;
+        if (wasAtBottom) chatMessages.scrollTop = chatMessages.scrollHeight;
+      }
+    }
+  }
+  
+  if (!bubble && loadingMessage) loadingMessage.remove();
+  return null;
+}
+
+// Show command suggestions to new users
+function maybeShowCommandSuggestions(message) {
+  if (message.toLowerCase() === "hi" || 
+      message.toLowerCase() === "hello" || 
+      message.toLowerCase() === "hey") {
+    setTimeout(() => {
+      addMessage("Would you like to try one of these commands?", false);
+      showCommandSuggestions();
+    }, 500);
+  }
 }
 
 function showCommandSuggestions() {
@@ -374,18 +461,27 @@ async function sendMessage() {
       requestData.action = 'add_event';
     }
     
-    const response = await fetch("/chat", {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        'X-Requested-With': 'XMLHttpRequest'
-      },
-      body: JSON.stringify(requestData),
-      credentials: "include"
-    });
-
     try {
-      const data = await handleApiResponse(response);
+      let data;
+      if (!requestData.follow_up && !isCommandMessage(message)) {
+        // Plain questions are streamed token by token
+        data = await streamChatResponse(requestData, loadingMessage);
+        if (!data) {
+          maybeShowCommandSuggestions(message);
+          return;
+        }
+      } else {
+        const response = await fetch("/chat", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            'X-Requested-With': 'XMLHttpRequest'
+          },
+          body: JSON.stringify(requestData),
+          credentials: "include"
+        });
+        data = await handleApiResponse(response);
+      }
       
       // Check if this was a command response (for special formatting)
       const isCommand = data.command_detected === true;
@@ -455,15 +551,7 @@ async function sendMessage() {
         }
       }
       
-      // Show command suggestions to new users
-      if (message.toLowerCase() === "hi" || 
-          message.toLowerCase() === "hello" || 
-          message.toLowerCase() === "hey") {
-        setTimeout(() => {
-          addMessage("Would you like to try one of these commands?", false);
-          showCommandSuggestions();
-        }, 500);
-      }
+      maybeShowCommandSuggestions(message);
     } catch (error) {
       if (error.message === 'Authentication required') {
         // This will be handled by handleApiResponse
@@ -643,6 +731,11 @@ function addSuggestion(suggestion) {
     console.log(`Stored original event_date in suggestion DOM: ${eventDate}`);
   }
   
+  // Remember which email the suggestion came from so the event can be fingerprinted
+  if (suggestion.email_id) {
+    suggestedItem.dataset.emailId = suggestion.email_id;
+  }
+  
   // Also store the raw deadline date if available
   if (suggestion.deadline) {
     suggestedItem.dataset.deadline = suggestion.deadline;
@@ -652,7 +745,12 @@ function addSuggestion(suggestion) {
   suggestionBox.appendChild(div);
 }
 
-async function getSuggestions() {
+// How often to poll a running suggestion job
+const SUGGESTION_POLL_MS = 1000;
+// Incremented on every load so a superseded poll loop stops
+let suggestionLoadSeq = 0;
+
+async function getSuggestions(event) {
   // First, check if the filter dropdown exists, if not, create it
   let filterContainer = document.querySelector('.filter-container');
   
@@ -676,62 +774,48 @@ async function getSuggestions() {
   
   // Get the selected time period
   const timePeriod = document.getElementById('time-period-filter').value;
+  // The refresh button asks for a fresh run; page loads reuse a recent job's results
+  const refresh = !!(event && event.currentTarget && event.currentTarget.id === 'refresh-sug');
+  const loadSeq = ++suggestionLoadSeq;
   
   suggestionBox.innerHTML = '<div class="loading">Loading suggestions...</div>';
   try {
+    // Start (or join) a background suggestion job
     const response = await fetch("/addsuggestion", {
       method: "POST",
       headers: { 
         "Content-Type": "application/json",
         'X-Requested-With': 'XMLHttpRequest'
       },
-      body: JSON.stringify({ time_period: timePeriod }),
+      body: JSON.stringify({ time_period: timePeriod, async: true, refresh }),
       credentials: "include"
     });
 
     try {
-      const data = await handleApiResponse(response);
-      
-      // Clear the suggestions
-      suggestionBox.innerHTML = '';
+      const job = await handleApiResponse(response);
+      let renderedCount = -1;
       
-      if (data.suggestions?.length) {
-        // Get currently displayed tasks and deleted events
-        const currentEventIds = JSON.parse(localStorage.getItem('currentEventIds') || '[]');
-        const deletedEventIds = JSON.parse(localStorage.getItem('deletedEventIds') || '[]');
-        const existingTaskTexts = Array.from(taskList.querySelectorAll('.task-text'))
-          .map(el => el.textContent.toLowerCase().trim());
-        
-        // Filter suggestions to avoid duplicates
-        const filteredSuggestions = data.suggestions.filter(suggestion => {
-          // Skip suggestions that are already in the task list by title
-          const suggestionText = suggestion.text.toLowerCase().trim();
-          if (existingTaskTexts.includes(suggestionText)) {
-            console.log(`Skipping suggestion already in task list: ${suggestion.text}`);
-            return false;
-          }
-          
-          // Skip suggestions for emails that are already processed
-          const processedEmailIds = JSON.parse(localStorage.getItem('processedEmailIds') || '[]');
-          if (suggestion.email_id && (
-            deletedEventIds.includes(suggestion.email_id) || 
-            processedEmailIds.includes(suggestion.email_id) || 
-            document.querySelector(`.task-item[data-email-id="${suggestion.email_id}"]`)
-          )) {
-            console.log(`Skipping suggestion from processed email: ${suggestion.email_id}`);
-            return false;
-          }
-          
-          return true;
+      // Poll for progress, showing suggestions as soon as they are produced
+      while (loadSeq === suggestionLoadSeq) {
+        const statusResponse = await fetch(`/addsuggestion/${job.job_id}`, {
+          headers: { 'X-Requested-With': 'XMLHttpRequest' },
+          credentials: "include"
         });
+        const data = await handleApiResponse(statusResponse);
+        if (loadSeq !== suggestionLoadSeq) return;
         
-        if (filteredSuggestions.length > 0) {
-          filteredSuggestions.forEach(addSuggestion);
-        } else {
-          suggestionBox.innerHTML = '<div class="no-suggestions">No new suggestions found</div>';
+        if (data.status === 'failed') {
+          throw new Error(data.error || 'Suggestion job failed');
         }
-      } else {
-        suggestionBox.innerHTML = '<div class="no-suggestions">No suggestions found based on your interests</div>';
+        const finished = data.status === 'done';
+        const suggestions = data.suggestions || [];
+        
+        if (finished || suggestions.length !== renderedCount) {
+          renderSuggestions(suggestions, finished, data.progress || {});
+          renderedCount = suggestions.length;
+        }
+        if (finished) return;
+        await new Promise(resolve => setTimeout(resolve, SUGGESTION_POLL_MS));
       }
     } catch (error) {
       if (error.message === 'Authentication required') {
@@ -746,6 +830,60 @@ async function getSuggestions() {
   }
 }
 
+function renderSuggestions(suggestions, finished, progress) {
+  // Clear the suggestions
+  suggestionBox.innerHTML = '';
+  
+  if (suggestions.length) {
+    // Get currently displayed tasks and deleted events
+    const currentEventIds = JSON.parse(localStorage.getItem('currentEventIds') || '[]');
+    const deletedEventIds = JSON.parse(localStorage.getItem('deletedEventIds') || '[]');
+    const existingTaskTexts = Array.from(taskList.querySelectorAll('.task-text'))
+      .map(el => el.textContent.toLowerCase().trim());
+    
+    // Filter suggestions to avoid duplicates
+    const filteredSuggestions = suggestions.filter(suggestion => {
+      // Skip suggestions that are already in the task list by title
+      const suggestionText = suggestion.text.toLowerCase().trim();
+      if (existingTaskTexts.includes(suggestionText)) {
+        console.log(`Skipping suggestion already in task list: ${suggestion.text}`);
+        return false;
+      }
+      
+      // Skip suggestions for emails that are already processed
+      const processedEmailIds = JSON.parse(localStorage.getItem('processedEmailIds') || '[]');
+      if (suggestion.email_id && (
+        deletedEventIds.includes(suggestion.email_id) || 
+        processedEmailIds.includes(suggestion.email_id) || 
+        document.querySelector(`.task-item[data-email-id="${suggestion.email_id}"]`)
+      )) {
+        console.log(`Skipping suggestion from processed email: ${suggestion.email_id}`);
+        return false;
+      }
+      
+      return true;
+    });
+    
+    if (filteredSuggestions.length > 0) {
+      filteredSuggestions.forEach(addSuggestion);
+    } else if (finished) {
+      suggestionBox.innerHTML = '<div class="no-suggestions">No new suggestions found</div>';
+    }
+  } else if (finished) {
+    suggestionBox.innerHTML = '<div class="no-suggestions">No suggestions found based on your interests</div>';
+  }
+  
+  // While the job is still running, show how far along it is
+  if (!finished) {
+    const loading = document.createElement('div');
+    loading.className = 'loading';
+    loading.textContent = progress.total
+      ? `Loading suggestions... (${progress.completed || 0}/${progress.total} emails)`
+      : 'Loading suggestions...';
+    suggestionBox.appendChild(loading);
+  }
+}
+
 // Add styles for suggestion enhancements
 function addStyles() {
   const style = document.createElement('style');
@@ -1104,6 +1242,7 @@ document.addEventListener('DOMContentLoaded', async () => {
                   event_date: eventDate,        // Original date string from AI extraction
                   raw_deadline: deadlineData,   // Raw deadline string
                   display_date: deadline,       // Formatted display date
+                  email_id: suggestionItem.dataset.emailId || null,  // Source email for duplicate detection
                   debug_info: {                 // Extra debug info
                     has_event_date: !!eventDate,
                     has_deadline: !!deadline,
@@ -1,14 +1,20 @@
 # backend/utils/auth.py
 import os
 import json
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from functools import wraps
 from flask import session, jsonify, request, redirect
 from cryptography.fernet import Fernet
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
+from datetime import datetime, timedelta
 
-from config import TOKENS_DIR, KEY_FILE, SCOPES
+from utils import storage
+from config import TOKENS_DIR, KEY_FILE, SCOPES, CREDENTIALS_CACHE_SIZE, REFRESH_MARGIN_SECONDS
 
 # Ensure the tokens directory exists
 Path(TOKENS_DIR).mkdir(exist_ok=True)
@@ -24,6 +30,14 @@ else:
 
 cipher = Fernet(key)
 
+# user_id -> (Credentials, stored credentials version), most recently used last
+_credentials_cache = OrderedDict()
+_credentials_lock = threading.Lock()
+
+# user_id -> lock held while that user's token is being refreshed
+_refresh_locks = {}
+_refresh_locks_guard = threading.Lock()
+
 def get_flow():
     """Create and return a Google OAuth flow instance."""
     # Try to get credentials from environment variable first
@@ -48,20 +62,35 @@ def get_flow():
     )
 
 def save_credentials(user_id, credentials):
-    """Encrypt and save credentials to a file."""
-    token_path = os.path.join(TOKENS_DIR, f"{user_id}.json")
+    """Encrypt and save credentials to the database."""
     creds_json = credentials.to_json()
     encrypted_creds = cipher.encrypt(creds_json.encode())
-    with open(token_path, 'wb') as f:
-        f.write(encrypted_creds)
+    version = storage.put_credentials(user_id, encrypted_creds)
+    _cache_credentials(user_id, credentials, version)
 
 def load_credentials(user_id):
-    """Load and decrypt credentials from a file."""
-    token_path = os.path.join(TOKENS_DIR, f"{user_id}.json")
-    if not os.path.exists(token_path):
+    """Load and decrypt credentials from the database.
+
+    Decrypted credentials are kept in a process-local LRU cache and reused
+    as long as the stored version is unchanged, so the decrypt happens once
+    per user per process and later loads only read the version number.
+    """
+    version = storage.get_credentials_version(user_id)
+    if version is None:
+        invalidate_credentials(user_id)
+        return None
+
+    with _credentials_lock:
+        cached = _credentials_cache.get(user_id)
+        if cached and cached[1] == version:
+            _credentials_cache.move_to_end(user_id)
+            return cached[0]
+
+    stored = storage.get_credentials(user_id)
+    if stored is None:
+        invalidate_credentials(user_id)
         return None
-    with open(token_path, 'rb') as f:
-        encrypted_creds = f.read()
+    encrypted_creds, version = stored
     decrypted_creds = cipher.decrypt(encrypted_creds).decode()
     credentials = Credentials.from_authorized_user_info(json.loads(decrypted_creds))
     
@@ -72,12 +101,109 @@ def load_credentials(user_id):
             print(f"Stored: {credentials.scopes}")
             print(f"Required: {SCOPES}")
             # Force reauthorization by invalidating credentials
-            if os.path.exists(token_path):
-                os.remove(token_path)
+            storage.delete_credentials(user_id)
+            forget_user(user_id)
             return None
             
+    _cache_credentials(user_id, credentials, version)
     return credentials
 
+def _cache_credentials(user_id, credentials, version):
+    """Store live credentials in the LRU cache, evicting the least recently used users."""
+    with _credentials_lock:
+        _credentials_cache[user_id] = (credentials, version)
+        _credentials_cache.move_to_end(user_id)
+        while len(_credentials_cache) > CREDENTIALS_CACHE_SIZE:
+            _credentials_cache.popitem(last=False)
+
+def invalidate_credentials(user_id):
+    """Drop a user's cached credentials so the next load reads the database again."""
+    with _credentials_lock:
+        _credentials_cache.pop(user_id, None)
+
+def list_user_ids():
+    """Return the IDs of all users with stored credentials."""
+    return storage.list_user_ids()
+
+def needs_refresh(credentials, margin_seconds=0):
+    """Check whether credentials are expired or will expire within margin_seconds."""
+    if not credentials.refresh_token:
+        return False
+    if not credentials.valid:
+        return True
+    if credentials.expiry is None:
+        return False
+    # google-auth stores expiry as a naive UTC datetime
+    return credentials.expiry - datetime.utcnow() < timedelta(seconds=margin_seconds)
+
+def refresh_credentials(user_id, margin_seconds=0):
+    """
+    Refresh a user's access token, collapsing concurrent refreshes into one call.
+
+    Callers for the same user wait on a per-user lock; once it is acquired the
+    credentials are re-checked, so only the first caller talks to Google and
+    stores the new token. Returns the (possibly refreshed) credentials or
+    None if the user has no stored credentials. Refresh errors propagate;
+    if Google rejects the refresh token (revoked or expired grant), the
+    stored credentials are deleted first, so the user is asked to log in
+    again and background jobs stop retrying them.
+    """
+    with _refresh_locks_guard:
+        lock = _refresh_locks.setdefault(user_id, threading.Lock())
+    with lock:
+        credentials = load_credentials(user_id)
+        if credentials is None or not needs_refresh(credentials, margin_seconds):
+            return credentials
+        try:
+            credentials.refresh(Request())
+        except RefreshError as e:
+            print(f"Refresh token for {user_id} was rejected, removing stored credentials: {e}")
+            storage.delete_credentials(user_id)
+            forget_user(user_id)
+            raise
+        save_credentials(user_id, credentials)
+        return credentials
+
+def forget_user(user_id):
+    """Drop every in-memory trace of a user's credentials (cache entry and refresh lock)."""
+    invalidate_credentials(user_id)
+    with _refresh_locks_guard:
+        _refresh_locks.pop(user_id, None)
+
+def get_valid_credentials(user_id):
+    """
+    Load credentials that are ready to use, refreshing them if they have expired.
+
+    Returns None if the user has no credentials or they cannot be refreshed
+    (no refresh token). Errors from the refresh itself propagate.
+    """
+    credentials = load_credentials(user_id)
+    if credentials is None or credentials.valid:
+        return credentials
+    if not credentials.refresh_token:
+        return None
+    return refresh_credentials(user_id)
+
+def refresh_expiring_credentials():
+    """Background job: refresh tokens that expire within REFRESH_MARGIN_SECONDS."""
+    refreshed = 0
+    user_ids = list_user_ids()
+    # Drop refresh locks of users whose credentials are gone so the table does not grow forever
+    with _refresh_locks_guard:
+        for stale in set(_refresh_locks) - set(user_ids):
+            if not _refresh_locks[stale].locked():
+                del _refresh_locks[stale]
+    for user_id in user_ids:
+        try:
+            credentials = load_credentials(user_id)
+            if credentials and needs_refresh(credentials, REFRESH_MARGIN_SECONDS):
+                refresh_credentials(user_id, REFRESH_MARGIN_SECONDS)
+                refreshed += 1
+        except Exception as e:
+            print(f"Failed to refresh credentials for {user_id}: {e}")
+    if refreshed:
+        print(f"Proactively refreshed credentials for {refreshed} user(s)")
+
 def require_auth(view):
     """Decorator to require authentication for routes."""
     @wraps(view)
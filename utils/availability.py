@@ -0,0 +1,286 @@
+# backend/utils/availability.py
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta, time
+
+from config import (
+    WORK_DAY_START, WORK_DAY_END, MIN_SLOT_MINUTES,
+    SUGGEST_STEP_MINUTES, SUGGEST_BUFFER_MINUTES,
+)
+from utils.event_store import parse_event_time
+
+def _parse_clock(value):
+    hour, minute = value.split(':')
+    return time(int(hour), int(minute))
+
+DEFAULT_WORK_START = _parse_clock(WORK_DAY_START)
+DEFAULT_WORK_END = _parse_clock(WORK_DAY_END)
+
+MINUTES_PER_DAY = 24 * 60
+
+# Named parts of the day a suggestion can be steered towards, as (start, end) minutes after midnight
+PREFERENCE_WINDOWS = {
+    'morning': (9 * 60, 12 * 60),
+    'afternoon': (12 * 60, 17 * 60),
+    'evening': (17 * 60, 20 * 60),
+}
+_PREFERENCE_ALIASES = {
+    'morning': 'morning', 'am': 'morning', 'early': 'morning',
+    'afternoon': 'afternoon', 'noon': 'afternoon', 'lunch': 'afternoon',
+    'evening': 'evening', 'night': 'evening', 'pm': 'evening', 'late': 'evening',
+}
+
+def preference_window(preference):
+    """Map a free-text preference ("morning", "lunch", ...) to its (start, end) minutes, or None."""
+    if not preference:
+        return None
+    name = _PREFERENCE_ALIASES.get(str(preference).strip().lower())
+    return PREFERENCE_WINDOWS.get(name)
+
+def _span_mask(start, end):
+    """Bitmask with bits start..end-1 set (minute offsets within a day)."""
+    start = max(start, 0)
+    end = min(end, MINUTES_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+def _window_starts(free, length):
+    """
+    Bit i of the result is set when minutes i..i+length-1 are all set in free.
+
+    Shifts double the covered span each round, so any window length costs
+    O(log length) big-int operations rather than a loop per minute.
+    """
+    result = free
+    span = 1
+    while span < length and result:
+        step = min(span, length - span)
+        result &= result >> step
+        span += step
+    return result
+
+def _iter_bits(mask):
+    """Yield the positions of the set bits of mask in ascending order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def _minute_of_day(value, day, tz):
+    """Wall-clock minutes from the start of day in tz (negative before, >= 1440 after)."""
+    local = value.astimezone(tz)
+    return (local.date() - day).days * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+class AvailabilityIndex:
+    """Busy intervals of one calendar snapshot, sorted and merged once for fast free-slot queries.
+
+    Build it with from_events() (formatted or raw calendar events) or
+    from_intervals() (plain (start, end) pairs), then ask for free slots
+    over any range of days in a single pass.
+    """
+
+    def __init__(self, busy):
+        # busy: iterable of (start, end, summary) with timezone-aware datetimes
+        self.events = sorted((b for b in busy if b[1] > b[0]), key=lambda b: (b[0], b[1]))
+        merged = []
+        for start, end, _ in self.events:
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        self._starts = [interval[0] for interval in merged]
+        self._ends = [interval[1] for interval in merged]
+        # Minute-resolution busy bitmaps keyed by (day, timezone name), built lazily
+        self._occupancy = {}
+
+    @classmethod
+    def from_events(cls, events):
+        """Build an index from calendar events, skipping all-day and unparseable events."""
+        busy = []
+        for event in events:
+            start = event.get('start') or {}
+            end = event.get('end') or {}
+            if not start.get('dateTime') or not end.get('dateTime'):
+                continue
+            try:
+                busy.append((parse_event_time(start), parse_event_time(end), event.get('summary', 'No Title')))
+            except ValueError as e:
+                print(f"Error parsing event date: {e}")
+        return cls(busy)
+
+    @classmethod
+    def from_intervals(cls, intervals, label='Busy'):
+        """Build an index from (start, end) pairs that carry no event details."""
+        return cls((start, end, label) for start, end in intervals)
+
+    def _free_between(self, start, end, min_length, position):
+        """Free gaps in [start, end) scanning merged intervals from position; returns (gaps, position)."""
+        # Skip intervals that finished before this window
+        while position < len(self._ends) and self._ends[position] <= start:
+            position += 1
+        gaps = []
+        cursor = start
+        index = position
+        while index < len(self._starts) and self._starts[index] < end:
+            if self._starts[index] - cursor >= min_length:
+                gaps.append((cursor, self._starts[index]))
+            cursor = max(cursor, self._ends[index])
+            index += 1
+        if end - cursor >= min_length:
+            gaps.append((cursor, end))
+        return gaps, position
+
+    def free_slots(self, start_date, end_date, tz, work_start=None, work_end=None, min_minutes=None):
+        """
+        Find free slots inside working hours for every day from start_date to end_date (inclusive).
+
+        Args:
+            start_date, end_date: datetime.date bounds of the query
+            tz: pytz timezone the working hours are expressed in
+            work_start, work_end: datetime.time working hours (default WORK_DAY_START/END)
+            min_minutes: shortest slot worth returning (default MIN_SLOT_MINUTES)
+
+        Returns:
+            OrderedDict mapping each date to a list of (start, end) tuples in tz
+        """
+        work_start = work_start or DEFAULT_WORK_START
+        work_end = work_end or DEFAULT_WORK_END
+        min_length = timedelta(minutes=MIN_SLOT_MINUTES if min_minutes is None else min_minutes)
+
+        results = OrderedDict()
+        first_start = tz.localize(datetime.combine(start_date, work_start))
+        position = bisect_right(self._ends, first_start)
+        day = start_date
+        while day <= end_date:
+            day_start = tz.localize(datetime.combine(day, work_start))
+            day_end = tz.localize(datetime.combine(day, work_end))
+            gaps, position = self._free_between(day_start, day_end, min_length, position)
+            results[day] = [(gap_start.astimezone(tz), gap_end.astimezone(tz)) for gap_start, gap_end in gaps]
+            day += timedelta(days=1)
+        return results
+
+    def booked(self, day, tz, work_start=None, work_end=None):
+        """Events touching day in tz as (start, end, summary), clipped to working hours when they span days."""
+        work_start = work_start or DEFAULT_WORK_START
+        work_end = work_end or DEFAULT_WORK_END
+        day_start = tz.localize(datetime.combine(day, work_start))
+        day_end = tz.localize(datetime.combine(day, work_end))
+        midnight = tz.localize(datetime.combine(day, time(0, 0)))
+        next_midnight = tz.localize(datetime.combine(day + timedelta(days=1), time(0, 0)))
+        booked = []
+        for start, end, summary in self.events:
+            if start >= next_midnight:
+                break
+            if end <= midnight:
+                continue
+            start, end = start.astimezone(tz), end.astimezone(tz)
+            if start.date() < day:
+                start = day_start
+            if end.date() > day:
+                end = day_end
+            booked.append((start, end, summary))
+        return booked
+
+    def occupancy(self, day, tz):
+        """
+        Busy bitmap of day in tz: bit i is set when minute i after local midnight is taken.
+
+        Python ints serve as the array, so ANDs and shifts over a whole day
+        are single operations. Bitmaps are cached per day on the index.
+        """
+        key = (day, tz.zone)
+        mask = self._occupancy.get(key)
+        if mask is not None:
+            return mask
+        midnight = tz.localize(datetime.combine(day, time(0, 0)))
+        next_midnight = tz.localize(datetime.combine(day + timedelta(days=1), time(0, 0)))
+        mask = 0
+        position = bisect_right(self._ends, midnight)
+        while position < len(self._starts) and self._starts[position] < next_midnight:
+            start = _minute_of_day(self._starts[position], day, tz)
+            # Round partial minutes up so a meeting ending at 10:00:30 still blocks 10:00
+            end_value = self._ends[position]
+            end = _minute_of_day(end_value, day, tz) + (1 if end_value.second or end_value.microsecond else 0)
+            mask |= _span_mask(start, end)
+            position += 1
+        self._occupancy[key] = mask
+        return mask
+
+    def rank_slots(self, start_date, end_date, tz, duration, preference=None, limit=5,
+                   step=None, buffer=None, work_start=None, work_end=None, not_before=None):
+        """
+        Score every free start time for a duration-minute event over several days and return the best.
+
+        Candidates are found per day with one bitmap window search. Lower
+        scores win: earlier days first, then slots inside the preferred part
+        of the day, then slots with free buffer on both sides, then start
+        times closest to the preferred window (or working day) start.
+        Returned slots never overlap each other.
+
+        Args:
+            start_date, end_date: datetime.date bounds of the search (inclusive)
+            tz: pytz timezone the working hours are expressed in
+            duration: event length in minutes
+            preference: free-text part of day ("morning", "afternoon", ...), optional
+            limit: maximum number of slots to return
+            step: start-time granularity in minutes (default SUGGEST_STEP_MINUTES)
+            buffer: free minutes wanted before and after (default SUGGEST_BUFFER_MINUTES)
+            work_start, work_end: datetime.time working hours (default WORK_DAY_START/END)
+            not_before: aware datetime; earlier start times are skipped (e.g. now)
+
+        Returns:
+            List of (start, end) tuples in tz, best first
+        """
+        work_start = work_start or DEFAULT_WORK_START
+        work_end = work_end or DEFAULT_WORK_END
+        step = max(int(step or SUGGEST_STEP_MINUTES), 1)
+        buffer = SUGGEST_BUFFER_MINUTES if buffer is None else buffer
+        duration = int(duration)
+        if duration <= 0 or duration > MINUTES_PER_DAY:
+            return []
+
+        work_mask = _span_mask(work_start.hour * 60 + work_start.minute, work_end.hour * 60 + work_end.minute)
+        all_minutes = _span_mask(0, MINUTES_PER_DAY)
+        grid = sum(1 << minute for minute in range(0, MINUTES_PER_DAY, step))
+        window = preference_window(preference)
+        anchor = window[0] if window else work_start.hour * 60 + work_start.minute
+        preferred = _span_mask(*window) if window else all_minutes
+
+        candidates = []
+        day = start_date
+        while day <= end_date:
+            free = ~self.occupancy(day, tz) & all_minutes
+            starts = _window_starts(free & work_mask, duration) & grid
+            if not_before is not None:
+                cutoff = _minute_of_day(not_before, day, tz)
+                starts &= ~_span_mask(0, cutoff) if cutoff > 0 else all_minutes
+            if starts:
+                # A start is buffered when the wider window around it is free as well
+                buffered = _window_starts(free, duration + 2 * buffer) << buffer if buffer else starts
+                day_offset = (day - start_date).days
+                for minute in _iter_bits(starts):
+                    bit = 1 << minute
+                    score = (
+                        day_offset * 10000
+                        + (0 if preferred & bit else 1000)
+                        + (0 if buffered & bit else 100)
+                        + abs(minute - anchor) / 60
+                    )
+                    candidates.append((score, day, minute))
+            day += timedelta(days=1)
+
+        candidates.sort()
+        chosen = []
+        taken = {}
+        for _, day, minute in candidates:
+            if len(chosen) >= limit:
+                break
+            span = _span_mask(minute, minute + duration)
+            if taken.get(day, 0) & span:
+                continue
+            taken[day] = taken.get(day, 0) | span
+            start = tz.localize(datetime.combine(day, time(minute // 60, minute % 60)))
+            chosen.append((start, tz.normalize(start + timedelta(minutes=duration))))
+        return chosen
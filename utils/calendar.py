@@ -1,41 +1,61 @@
 # backend/utils/calendar.py
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import threading
 import traceback
 import pytz
-from tzlocal import get_localzone
+from utils.services import get_service, execute_batch
+from utils.models import UserPreferences
+from config import AVAILABILITY_CALENDAR_IDS, DEFAULT_TIMEZONE
+from utils.event_store import list_events, remember_event, forget_event, parse_event_time
+from utils.fingerprints import fingerprint_properties
 
-def create_calendar_event(creds, subject, sender, date_str, iso_date, end_date=None, description=None, set_reminder=False):
-    """Creates a calendar event based on email details.
+# user_id -> IANA timezone name from the user's Calendar settings
+_user_timezones = {}
+_timezones_lock = threading.Lock()
+
+def _valid_timezone(name):
+    return bool(name) and name in pytz.all_timezones_set
+
+def get_user_timezone(creds, user_id, refresh=False):
+    """Return the user's Calendar timezone name (e.g. "Europe/Berlin").
     
-    Args:
-        creds: Google API credentials
-        subject: Event subject/title
-        sender: Email sender
-        date_str: Original date string
-        iso_date: ISO formatted date for the event start time
-        end_date: Optional end time (if None, will be set to start + 1 hour)
-        description: Optional detailed description for the event
-        set_reminder: Whether to set a reminder 24 hours before the event
+    Resolved once from the Calendar settings API, then kept in memory and in
+    the user's preferences so later processes skip the lookup. Pass
+    refresh=True (e.g. at login) to re-read it from Calendar. Falls back to
+    DEFAULT_TIMEZONE if the setting cannot be read.
     """
-    calendar_service = build('calendar', 'v3', credentials=creds)
+    if not refresh:
+        with _timezones_lock:
+            cached = _user_timezones.get(user_id)
+        if cached:
+            return cached
+        if user_id:
+            stored = UserPreferences.load_preferences(user_id).get('timezone')
+            if _valid_timezone(stored):
+                with _timezones_lock:
+                    _user_timezones[user_id] = stored
+                return stored
     
-    # Debug incoming date information
-    print(f"\n==== CALENDAR EVENT CREATION ====")
-    print(f"Subject: {subject}")
-    print(f"ISO Date: {iso_date}")
-    print(f"End Date: {end_date}")
-    
-    # Get user's local timezone
     try:
-        local_tz = get_localzone()
-        timezone_str = str(local_tz)
-        print(f"Using timezone: {timezone_str}")
-    except:
-        # Fallback to a common timezone if detection fails
-        timezone_str = 'America/New_York'
-        print(f"Timezone detection failed, using fallback: {timezone_str}")
+        calendar_service = get_service('calendar', 'v3', creds)
+        timezone_str = calendar_service.settings().get(setting='timezone').execute().get('value')
+    except Exception as e:
+        print(f"Could not read Calendar timezone for {user_id}: {e}")
+        timezone_str = None
+    if not _valid_timezone(timezone_str):
+        print(f"Using default timezone {DEFAULT_TIMEZONE} for {user_id}")
+        return DEFAULT_TIMEZONE
+    
+    if user_id:
+        with _timezones_lock:
+            _user_timezones[user_id] = timezone_str
+        UserPreferences.update_preferences(user_id, {'timezone': timezone_str})
+    return timezone_str
+
+def build_event_body(subject, sender, date_str, iso_date, end_date=None, description=None, set_reminder=False, timezone_str=None, source_id=None):
+    """Build the Calendar API body for an event; arguments match create_calendar_event."""
+    timezone_str = timezone_str or DEFAULT_TIMEZONE
     
     # Remove the Z from ISO date which indicates UTC
     if iso_date.endswith('Z'):
@@ -71,40 +91,65 @@ def create_calendar_event(creds, subject, sender, date_str, iso_date, end_date=N
     if iso_date.endswith('T09:00:00'):
         print(f"WARNING: Date appears to be default 9am time: {iso_date}")
     
-    event_body = {
+    # Always add 30 min popup reminder
+    reminders = [{'method': 'popup', 'minutes': 30}]
+    
+    # Add day-before reminder if requested
+    if set_reminder:
+        reminders.append({'method': 'email', 'minutes': 24 * 60})  # 24 hours before
+        reminders.append({'method': 'popup', 'minutes': 24 * 60})  # 24 hours before
+    
+    print(f"Event start datetime: {iso_date}")
+    print(f"Event end datetime: {end_iso_date}")
+    print(f"Event timezone: {timezone_str}")
+    
+    return {
         'summary': f'{subject}',
         'description': event_description,
         'start': {'dateTime': iso_date, 'timeZone': timezone_str},
         'end': {'dateTime': end_iso_date, 'timeZone': timezone_str},
         'reminders': {
             'useDefault': False,
-            'overrides': []
+            'overrides': reminders
+        },
+        # Fingerprint used to recognize this event as a duplicate later (see utils.fingerprints)
+        'extendedProperties': {
+            'private': fingerprint_properties(subject, source_id)
         }
     }
+
+def create_calendar_event(creds, subject, sender, date_str, iso_date, end_date=None, description=None, set_reminder=False, timezone_str=None, source_id=None):
+    """Creates a calendar event based on email details.
     
-    print(f"Event start datetime: {iso_date}")
-    print(f"Event end datetime: {end_iso_date}")
-    print(f"Event timezone: {timezone_str}")
-    
-    # Add reminders
-    reminders = []
-    
-    # Always add 30 min popup reminder
-    reminders.append({'method': 'popup', 'minutes': 30})
+    Args:
+        creds: Google API credentials
+        subject: Event subject/title
+        sender: Email sender
+        date_str: Original date string
+        iso_date: ISO formatted date for the event start time
+        end_date: Optional end time (if None, will be set to start + 1 hour)
+        description: Optional detailed description for the event
+        set_reminder: Whether to set a reminder 24 hours before the event
+        timezone_str: User's timezone name, e.g. from get_user_timezone (default DEFAULT_TIMEZONE)
+        source_id: Gmail message ID the event was created from, if any
+    """
+    calendar_service = get_service('calendar', 'v3', creds)
     
-    # Add day-before reminder if requested
-    if set_reminder:
-        reminders.append({'method': 'email', 'minutes': 24 * 60})  # 24 hours before
-        reminders.append({'method': 'popup', 'minutes': 24 * 60})  # 24 hours before
+    # Debug incoming date information
+    print(f"\n==== CALENDAR EVENT CREATION ====")
+    print(f"Subject: {subject}")
+    print(f"ISO Date: {iso_date}")
+    print(f"End Date: {end_date}")
     
-    event_body['reminders']['overrides'] = reminders
+    event_body = build_event_body(subject, sender, date_str, iso_date, end_date, description, set_reminder, timezone_str, source_id)
     
     try:
         event = calendar_service.events().insert(
             calendarId='primary',
             body=event_body
         ).execute()
-        print(f"Created event: {event.get('htmlLink')} with {len(reminders)} reminder(s)")
+        remember_event(creds, event)
+        print(f"Created event: {event.get('htmlLink')} with {len(event_body['reminders']['overrides'])} reminder(s)")
         print(f"==== END CALENDAR EVENT CREATION ====\n")
         return event
     except Exception as e:
@@ -112,35 +157,56 @@ def create_calendar_event(creds, subject, sender, date_str, iso_date, end_date=N
         print(traceback.format_exc())
         raise
 
+def batch_create_calendar_events(creds, event_bodies):
+    """Insert several events through the Calendar batch endpoint.
+    
+    Args:
+        creds: Google API credentials
+        event_bodies: Event bodies, e.g. from build_event_body
+    
+    Returns:
+        One result per body, in order: {"status": "created", "event": event}
+        or {"status": "error", "error": message}
+    """
+    calendar_service = get_service('calendar', 'v3', creds)
+    requests = [
+        (str(i), calendar_service.events().insert(calendarId='primary', body=body))
+        for i, body in enumerate(event_bodies)
+    ]
+    created, errors = execute_batch(calendar_service, requests)
+    
+    results = []
+    for i in range(len(event_bodies)):
+        event = created.get(str(i))
+        if event is not None:
+            remember_event(creds, event)
+            results.append({"status": "created", "event": event})
+        else:
+            results.append({"status": "error", "error": str(errors.get(str(i), "Unknown error"))})
+    print(f"Batch created {len(created)} of {len(event_bodies)} calendar events")
+    return results
+
+def _is_gone(error):
+    """True if an HttpError means the event no longer exists."""
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
 def delete_calendar_event(creds, event_id):
-    """Deletes a calendar event by ID."""
+    """Deletes a calendar event by ID; an event that is already gone counts as deleted."""
     try:
         print(f"Attempting to delete calendar event with ID: {event_id}")
-        calendar_service = build('calendar', 'v3', credentials=creds)
-        
-        # First, try to get the event to confirm it exists
-        try:
-            event = calendar_service.events().get(
-                calendarId='primary',
-                eventId=event_id
-            ).execute()
-            print(f"Found event to delete: {event.get('summary', 'No title')} ({event_id})")
-        except HttpError as e:
-            if e.resp.status == 404:
-                print(f"Event {event_id} not found - it may have been already deleted")
-                return {"status": "not_found", "message": "Event already deleted"}
-            else:
-                print(f"Error checking event existence: {str(e)}")
-                raise
-        
-        # If we got here, the event exists, so delete it
-        result = calendar_service.events().delete(
+        calendar_service = get_service('calendar', 'v3', creds)
+        calendar_service.events().delete(
             calendarId='primary',
             eventId=event_id
         ).execute()
+        forget_event(creds, event_id)
         print(f"Successfully deleted event with ID: {event_id}")
         return {"status": "deleted", "message": "Event deleted successfully"}
     except HttpError as e:
+        if _is_gone(e):
+            print(f"Event {event_id} not found - it may have been already deleted")
+            forget_event(creds, event_id)
+            return {"status": "not_found", "message": "Event already deleted"}
         print(f"Google API error during deletion: {str(e)}")
         print(traceback.format_exc())
         raise
@@ -149,18 +215,47 @@ def delete_calendar_event(creds, event_id):
         print(traceback.format_exc())
         raise
 
-def fetch_calendar_events(creds):
-    """Fetch upcoming calendar events."""
-    service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
-    now = datetime.utcnow().isoformat() + 'Z'
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=now, 
-        maxResults=10,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-    items = events_result.get('items', [])
+def batch_delete_calendar_events(creds, event_ids):
+    """Delete several events through the Calendar batch endpoint.
+    
+    Returns:
+        Dict mapping each event ID to "deleted", "not_found" (already gone)
+        or an error message
+    """
+    calendar_service = get_service('calendar', 'v3', creds)
+    event_ids = list(dict.fromkeys(event_ids))
+    requests = [
+        (event_id, calendar_service.events().delete(calendarId='primary', eventId=event_id))
+        for event_id in event_ids
+    ]
+    deleted, errors = execute_batch(calendar_service, requests)
+    
+    results = {}
+    for event_id in event_ids:
+        error = errors.get(event_id)
+        if error is None:
+            results[event_id] = "deleted"
+        elif _is_gone(error):
+            results[event_id] = "not_found"
+        else:
+            results[event_id] = str(error)
+            continue
+        forget_event(creds, event_id)
+    print(f"Batch deleted {len(deleted)} of {len(event_ids)} calendar events")
+    return results
+
+def fetch_calendar_events(creds, time_min=None, time_max=None, max_results=10):
+    """Fetch calendar events from the user's event store.
+    
+    Args:
+        creds: Google API credentials
+        time_min: Only include events ending after this aware datetime (default: now)
+        time_max: Only include events starting before this aware datetime
+        max_results: Maximum number of events to return (None for all)
+    """
+    if time_min is None:
+        time_min = datetime.now(timezone.utc)
+    items = list_events(creds, time_min=time_min, time_max=time_max, max_results=max_results)
     formatted_events = []
     for event in items:
         formatted_event = {
@@ -173,3 +268,41 @@ def fetch_calendar_events(creds):
         }
         formatted_events.append(formatted_event)
     return formatted_events
+
+def fetch_busy_intervals(creds, time_min, time_max, calendar_ids=None):
+    """Fetch busy intervals between time_min and time_max with a single freeBusy query.
+    
+    Only (start, end) pairs come back, so no event bodies are downloaded, and
+    several calendars can be checked in one call. Events marked as "free" or
+    declined do not count as busy.
+    
+    Args:
+        creds: Google API credentials
+        time_min, time_max: Aware datetimes bounding the query
+        calendar_ids: Calendar IDs to check (default AVAILABILITY_CALENDAR_IDS)
+    
+    Returns:
+        Sorted list of (start, end) tuples with timezone-aware UTC datetimes
+    """
+    calendar_ids = list(calendar_ids or AVAILABILITY_CALENDAR_IDS)
+    calendar_service = get_service('calendar', 'v3', creds)
+    result = calendar_service.freebusy().query(body={
+        'timeMin': time_min.isoformat(),
+        'timeMax': time_max.isoformat(),
+        'items': [{'id': calendar_id} for calendar_id in calendar_ids]
+    }).execute()
+    
+    intervals = []
+    for calendar_id, calendar in result.get('calendars', {}).items():
+        if calendar.get('errors'):
+            # e.g. notFound for a calendar the user can no longer see; the others still count
+            print(f"freeBusy error for calendar {calendar_id}: {calendar['errors']}")
+            continue
+        for period in calendar.get('busy', []):
+            try:
+                intervals.append((parse_event_time({'dateTime': period['start']}),
+                                  parse_event_time({'dateTime': period['end']})))
+            except (KeyError, ValueError) as e:
+                print(f"Error parsing busy period {period}: {e}")
+    intervals.sort()
+    return intervals
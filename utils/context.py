@@ -0,0 +1,75 @@
+# backend/utils/context.py
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from config import CHAT_CONTEXT_DEADLINE, CONTEXT_WORKERS
+from utils.calendar import fetch_calendar_events
+from utils.gmail import fetch_emails
+
+# Shared pool for context fetches; a fetch that misses its deadline keeps running here, not in the request
+_executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix='chat-context')
+
+_CALENDAR_WORDS = re.compile(r'\b(?:calendar|schedule[ds]?|meetings?|events?|appointments?|agenda|busy|free)\b', re.IGNORECASE)
+
+def _fetch_calendar(creds, user_id):
+    return fetch_calendar_events(creds)
+
+def _fetch_emails(creds, user_id):
+    return fetch_emails(user_id)
+
+# Source name -> (prompt label, fetch(creds, user_id))
+CONTEXT_SOURCES = {
+    'calendar': ('Calendar Events', _fetch_calendar),
+    'emails': ('Emails', _fetch_emails),
+}
+
+def select_sources(user_message):
+    """
+    Decide which context sources a chat message needs.
+
+    "@email" asks about the inbox; everything else is answered from the
+    calendar. A message that mentions "@email" and calendar words gets both.
+    """
+    lowered = user_message.lower()
+    if '@email' not in lowered:
+        return ['calendar']
+    sources = ['emails']
+    if _CALENDAR_WORDS.search(lowered.replace('@email', ' ')):
+        sources.append('calendar')
+    return sources
+
+def build_context(user_message, creds, user_id, deadline=None):
+    """
+    Fetch the context sources a message needs, concurrently, within a deadline.
+
+    Returns an ordered list of (label, data) pairs for the sources that
+    arrived in time and produced data. A source that times out or fails is
+    left out, and the prompt is built from the rest.
+    """
+    deadline = CHAT_CONTEXT_DEADLINE if deadline is None else deadline
+    started = time.monotonic()
+    futures = {
+        name: _executor.submit(CONTEXT_SOURCES[name][1], creds, user_id)
+        for name in select_sources(user_message)
+    }
+    wait(futures.values(), timeout=deadline)
+
+    context = []
+    for name, future in futures.items():
+        label = CONTEXT_SOURCES[name][0]
+        if not future.done():
+            print(f"Chat context source '{name}' missed the {deadline}s deadline; answering without it")
+            continue
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"Chat context source '{name}' failed: {e}")
+            continue
+        if isinstance(data, dict) and 'error' in data:
+            print(f"Chat context source '{name}' failed: {data['error']}")
+            continue
+        if data:
+            context.append((label, data))
+    print(f"Built chat context from {[label for label, _ in context]} in {time.monotonic() - started:.2f}s")
+    return context
@@ -0,0 +1,26 @@
+# backend/utils/conversation.py
+from config import CONVERSATION_STATE_TTL
+from utils import storage
+
+# Chat follow-up state (the suggested_event offered by @suggest) is kept out of the session, in the shared
+# storage database, so every worker process sees it. Each value expires CONVERSATION_STATE_TTL seconds
+# after it was last written.
+
+def remember(user_id, **values):
+    """Store follow-up values for a user; each call restarts their lifetime."""
+    storage.put_conversation_values(user_id, values, CONVERSATION_STATE_TTL)
+
+def take(user_id, key, default=None):
+    """Remove a stored follow-up value and return it, so it is used at most once."""
+    value = storage.take_conversation_value(user_id, key)
+    return default if value is None else value
+
+def forget(user_id):
+    """Drop all follow-up state for a user (e.g. on logout)."""
+    storage.delete_conversation_state(user_id)
+
+def prune_expired():
+    """Background job: delete expired follow-up state."""
+    removed = storage.prune_conversation_state()
+    if removed:
+        print(f"Pruned {removed} expired conversation value(s)")
@@ -0,0 +1,236 @@
+# backend/utils/dates.py
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, time
+
+HIGH = 'high'
+LOW = 'low'
+
+# Result of parse_temporal:
+#   date / end_date   - first and last day referenced (equal for a single day)
+#   start_time / end_time - datetime.time values, or None if no time was given
+#   confidence        - HIGH when the whole expression was understood, LOW otherwise
+#   remainder         - the input with every recognized date/time phrase removed
+TemporalParse = namedtuple('TemporalParse', ['date', 'end_date', 'start_time', 'end_time', 'confidence', 'remainder'])
+
+WEEKDAYS = {
+    'monday': 0, 'mon': 0,
+    'tuesday': 1, 'tue': 1, 'tues': 1,
+    'wednesday': 2, 'wed': 2,
+    'thursday': 3, 'thu': 3, 'thur': 3, 'thurs': 3,
+    'friday': 4, 'fri': 4,
+    'saturday': 5, 'sat': 5,
+    'sunday': 6, 'sun': 6,
+}
+
+MONTHS = {
+    'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3,
+    'april': 4, 'apr': 4, 'may': 5, 'june': 6, 'jun': 6, 'july': 7, 'jul': 7,
+    'august': 8, 'aug': 8, 'september': 9, 'sep': 9, 'sept': 9,
+    'october': 10, 'oct': 10, 'november': 11, 'nov': 11, 'december': 12, 'dec': 12,
+}
+
+_WEEKDAY = '|'.join(sorted(WEEKDAYS, key=len, reverse=True))
+_MONTH = '|'.join(sorted(MONTHS, key=len, reverse=True))
+_ORDINAL = r'(?:st|nd|rd|th)?'
+_TIME = r'(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?'
+
+_RANGE_PATTERNS = [
+    (re.compile(r'\b(?:the\s+)?(?:next|coming)\s+(\d{1,3})\s+days?\b'), 'next_days'),
+    (re.compile(r'\bthis\s+week\b'), 'this_week'),
+    (re.compile(r'\bnext\s+week\b'), 'next_week'),
+    (re.compile(r'\b(?:this\s+|next\s+)?weekend\b'), 'weekend'),
+]
+
+_DATE_PATTERNS = [
+    (re.compile(r'\bday\s+after\s+tomorrow\b'), 'day_after_tomorrow'),
+    (re.compile(r'\btomorrow\b'), 'tomorrow'),
+    (re.compile(r'\b(?:today|tonight)\b'), 'today'),
+    (re.compile(r'\byesterday\b'), 'yesterday'),
+    (re.compile(r'\bin\s+(\d{1,3})\s+(day|week)s?\b'), 'in_n'),
+    (re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b'), 'iso'),
+    (re.compile(rf'\b(?:on\s+)?(?:the\s+)?(\d{{1,2}}){_ORDINAL}\s+(?:of\s+)?({_MONTH})\.?(?:,?\s+(\d{{4}}))?\b'), 'day_month'),
+    (re.compile(rf'\b(?:on\s+)?({_MONTH})\.?\s+(\d{{1,2}}){_ORDINAL}(?:,?\s+(\d{{4}}))?\b'), 'month_day'),
+    (re.compile(r'\b(?:on\s+)?(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b'), 'numeric'),
+    (re.compile(rf'\b(?:(this|next|coming|on)\s+)?({_WEEKDAY})\b'), 'weekday'),
+]
+
+_TIME_RANGE = re.compile(rf'\b(?:from\s+|between\s+)?{_TIME}\s*(?:-|–|to|until|and)\s*{_TIME}(?!\w)')
+_TIME_SINGLE = re.compile(rf'\b(?:at\s+|@\s*)?(?:(\d{{1,2}})(?::(\d{{2}}))?\s*(am|pm|a\.m\.|p\.m\.)|([01]?\d|2[0-3]):([0-5]\d))(?!\w)')
+_TIME_WORDS = re.compile(r'\b(?:at\s+)?(noon|midday|midnight)\b')
+
+# Leftover words that do not make a date expression ambiguous
+_FILLER = re.compile(r'\b(?:on|at|for|by|from|the|of|in|and|to|until|between|around|about|this|next|coming)\b')
+_AMBIGUOUS = re.compile(rf'\d|\b(?:{_MONTH}|{_WEEKDAY})\b')
+
+def _to_time(hour, minute, meridiem):
+    hour = int(hour)
+    minute = int(minute or 0)
+    if meridiem:
+        meridiem = meridiem.replace('.', '')
+        if not 1 <= hour <= 12:
+            return None
+        if meridiem == 'pm' and hour != 12:
+            hour += 12
+        elif meridiem == 'am' and hour == 12:
+            hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+def _roll_forward(month, day, today):
+    """Resolve a month/day without a year to its next occurrence."""
+    candidate = datetime(today.year, month, day).date()
+    if candidate < today:
+        candidate = datetime(today.year + 1, month, day).date()
+    return candidate
+
+def _resolve_range(kind, match, today):
+    if kind == 'next_days':
+        return today, today + timedelta(days=max(int(match.group(1)), 1) - 1)
+    if kind == 'this_week':
+        return today, today + timedelta(days=6 - today.weekday())
+    if kind == 'next_week':
+        start = today + timedelta(days=7 - today.weekday())
+        return start, start + timedelta(days=6)
+    # weekend: the upcoming Saturday and Sunday (today counts if it is the weekend)
+    if today.weekday() == 6:
+        return today, today
+    start = today + timedelta(days=(5 - today.weekday()) % 7)
+    return start, start + timedelta(days=1)
+
+def _resolve_date(kind, match, today):
+    if kind == 'day_after_tomorrow':
+        return today + timedelta(days=2)
+    if kind == 'tomorrow':
+        return today + timedelta(days=1)
+    if kind == 'today':
+        return today
+    if kind == 'yesterday':
+        return today - timedelta(days=1)
+    if kind == 'in_n':
+        amount = int(match.group(1))
+        return today + timedelta(days=amount * (7 if match.group(2) == 'week' else 1))
+    if kind == 'iso':
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3))).date()
+    if kind in ('day_month', 'month_day'):
+        if kind == 'day_month':
+            day, month, year = match.group(1), match.group(2), match.group(3)
+        else:
+            month, day, year = match.group(1), match.group(2), match.group(3)
+        month = MONTHS[month]
+        if year:
+            return datetime(int(year), month, int(day)).date()
+        return _roll_forward(month, int(day), today)
+    if kind == 'numeric':
+        month, day, year = int(match.group(1)), int(match.group(2)), match.group(3)
+        if year:
+            year = int(year)
+            return datetime(year + 2000 if year < 100 else year, month, day).date()
+        return _roll_forward(month, day, today)
+    # weekday: "friday" and "this friday" include today, "next friday" is strictly after today
+    qualifier, name = match.group(1), match.group(2)
+    days_ahead = (WEEKDAYS[name] - today.weekday()) % 7
+    if days_ahead == 0 and qualifier in ('next', 'coming'):
+        days_ahead = 7
+    return today + timedelta(days=days_ahead)
+
+def parse_temporal(text, now=None):
+    """
+    Parse relative and absolute date/time expressions without calling the LLM.
+
+    Understands "today"/"tomorrow", weekdays, "in 3 days", ISO and written
+    dates ("March 5", "5th of March 2025"), ranges ("this week", "next 14
+    days", "weekend"), clock times ("3pm", "15:30", "noon") and time ranges
+    ("2-4pm"). Returns a TemporalParse, or None if nothing was recognized.
+    Confidence is LOW when the expression is ambiguous (numeric dates,
+    several dates, or leftover numbers/month/weekday names), in which case
+    callers should fall back to the model.
+    """
+    now = now or datetime.now()
+    today = now.date()
+    lowered = text.lower()
+    spans = []
+    confidence = HIGH
+
+    def consume(match):
+        spans.append(match.span())
+
+    def overlaps(match):
+        start, end = match.span()
+        return any(start < s_end and s_start < end for s_start, s_end in spans)
+
+    date = end_date = None
+    start_time = end_time = None
+
+    try:
+        for pattern, kind in _RANGE_PATTERNS:
+            match = pattern.search(lowered)
+            if match:
+                date, end_date = _resolve_range(kind, match, today)
+                consume(match)
+                break
+
+        for pattern, kind in _DATE_PATTERNS:
+            for match in pattern.finditer(lowered):
+                if overlaps(match):
+                    continue
+                if date is not None:
+                    # A second date expression makes the request ambiguous
+                    confidence = LOW
+                    break
+                date = end_date = _resolve_date(kind, match, today)
+                if kind == 'numeric':
+                    confidence = LOW
+                consume(match)
+
+        match = _TIME_RANGE.search(lowered)
+        if match and (match.group(3) or match.group(6)):
+            end_time = _to_time(match.group(4), match.group(5), match.group(6))
+            # "2-4pm": the start inherits the end's am/pm
+            start_meridiem = match.group(3) or match.group(6)
+            start_time = _to_time(match.group(1), match.group(2), start_meridiem)
+            if start_time and end_time and start_time > end_time and not match.group(3):
+                start_time = _to_time(match.group(1), match.group(2), 'am')
+            consume(match)
+        else:
+            for match in _TIME_SINGLE.finditer(lowered):
+                if overlaps(match):
+                    continue
+                if match.group(3):
+                    start_time = _to_time(match.group(1), match.group(2), match.group(3))
+                else:
+                    start_time = _to_time(match.group(4), match.group(5), None)
+                consume(match)
+                break
+            if start_time is None:
+                match = _TIME_WORDS.search(lowered)
+                if match and not overlaps(match):
+                    start_time = time(0, 0) if match.group(1) == 'midnight' else time(12, 0)
+                    consume(match)
+    except ValueError:
+        # Impossible calendar dates such as February 30th
+        return None
+
+    if date is None and start_time is None:
+        return None
+    if date is None:
+        date = end_date = today
+
+    remainder = lowered
+    for start, end in sorted(spans, reverse=True):
+        remainder = remainder[:start] + ' ' + remainder[end:]
+    if _AMBIGUOUS.search(_FILLER.sub(' ', remainder)):
+        confidence = LOW
+
+    # Keep the caller's original casing for the leftover text (e.g. an event title)
+    kept = []
+    position = 0
+    for start, end in sorted(spans):
+        kept.append(text[position:start])
+        position = end
+    kept.append(text[position:])
+    remainder = re.sub(r'\s+', ' ', ' '.join(kept)).strip(' ,.-')
+    remainder = re.sub(r'(?:\s+\b(?:on|at|for|by|from|this|next)\b)+$', '', remainder, flags=re.IGNORECASE).strip(' ,.-')
+
+    return TemporalParse(date, end_date, start_time, end_time, confidence, remainder)
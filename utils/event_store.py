@@ -0,0 +1,179 @@
+# backend/utils/event_store.py
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from googleapiclient.errors import HttpError
+
+from config import EVENT_STORE_TTL, EVENT_STORE_MAX_AGE, EVENT_STORE_LOOKBACK_DAYS, EVENT_STORE_MAX_USERS
+from utils.services import get_service, credential_identity
+from utils.fingerprints import event_fingerprints
+
+class _EventStore:
+    """In-memory copy of one user's primary calendar, kept fresh with syncToken."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        # event id -> (start, end, raw event) with timezone-aware UTC datetimes
+        self.events = {}
+        # fingerprint -> number of stored events carrying it (see utils.fingerprints)
+        self.fingerprints = Counter()
+        self.sync_token = None
+        self.synced_at = 0.0
+        self.full_synced_at = 0.0
+
+# credential identity -> _EventStore, least recently used first
+_stores = OrderedDict()
+_stores_lock = threading.Lock()
+
+def parse_event_time(value):
+    """Parse an event start/end ({'dateTime': ...} or {'date': ...}) into an aware UTC datetime."""
+    if not value:
+        return None
+    if value.get('dateTime'):
+        parsed = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+    if value.get('date'):
+        return datetime.fromisoformat(value['date']).replace(tzinfo=timezone.utc)
+    return None
+
+def _store_for(creds):
+    identity = credential_identity(creds)
+    with _stores_lock:
+        store = _stores.get(identity)
+        if store is None:
+            store = _EventStore()
+            _stores[identity] = store
+        _stores.move_to_end(identity)
+        while len(_stores) > EVENT_STORE_MAX_USERS:
+            _stores.popitem(last=False)
+        return store
+
+def _discard(store, event_id):
+    """Remove one event and its fingerprints from the store."""
+    entry = store.events.pop(event_id, None)
+    if entry is not None:
+        for fingerprint in event_fingerprints(entry[2]):
+            store.fingerprints[fingerprint] -= 1
+            if store.fingerprints[fingerprint] <= 0:
+                del store.fingerprints[fingerprint]
+
+def _apply(store, event):
+    """Insert, update or remove one event in the store."""
+    event_id = event.get('id')
+    if not event_id:
+        return
+    _discard(store, event_id)
+    if event.get('status') == 'cancelled':
+        return
+    try:
+        start = parse_event_time(event.get('start'))
+        end = parse_event_time(event.get('end')) or start
+    except ValueError:
+        return
+    if start is not None:
+        store.events[event_id] = (start, end, event)
+        store.fingerprints.update(event_fingerprints(event))
+
+def _list_pages(service, **params):
+    """Yield every page of an events.list call."""
+    page_token = None
+    while True:
+        response = service.events().list(calendarId='primary', pageToken=page_token, **params).execute()
+        yield response
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+def _full_sync(service, store):
+    time_min = datetime.now(timezone.utc) - timedelta(days=EVENT_STORE_LOOKBACK_DAYS)
+    # Build into a fresh store so a failed sync leaves the old snapshot intact
+    staging = _EventStore()
+    for page in _list_pages(service, singleEvents=True, maxResults=250,
+                            timeMin=time_min.isoformat().replace('+00:00', 'Z')):
+        for event in page.get('items', []):
+            _apply(staging, event)
+        staging.sync_token = page.get('nextSyncToken', staging.sync_token)
+    store.events = staging.events
+    store.fingerprints = staging.fingerprints
+    store.sync_token = staging.sync_token
+    store.full_synced_at = time.monotonic()
+
+def _incremental_sync(service, store):
+    sync_token = store.sync_token
+    for page in _list_pages(service, singleEvents=True, maxResults=250, syncToken=sync_token):
+        for event in page.get('items', []):
+            _apply(store, event)
+        sync_token = page.get('nextSyncToken', sync_token)
+    store.sync_token = sync_token
+
+def _sync(creds, store):
+    service = get_service('calendar', 'v3', creds)
+    now = time.monotonic()
+    if store.sync_token and now - store.full_synced_at < EVENT_STORE_MAX_AGE:
+        try:
+            _incremental_sync(service, store)
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            # The sync token expired; start over with a full sync
+            print("Calendar sync token expired, doing a full sync")
+            _full_sync(service, store)
+    else:
+        _full_sync(service, store)
+    # Drop events that have ended before the lookback window
+    cutoff = datetime.now(timezone.utc) - timedelta(days=EVENT_STORE_LOOKBACK_DAYS)
+    for event_id in [k for k, v in store.events.items() if v[1] < cutoff]:
+        _discard(store, event_id)
+    store.synced_at = time.monotonic()
+
+def list_events(creds, time_min=None, time_max=None, max_results=None):
+    """
+    Return the user's events overlapping [time_min, time_max), sorted by start.
+
+    Reads come from the in-memory store; it is refreshed with an
+    incremental syncToken sync once older than EVENT_STORE_TTL seconds and
+    fully resynced every EVENT_STORE_MAX_AGE seconds (or when Google
+    expires the token). time_min/time_max are aware datetimes.
+    """
+    store = _store_for(creds)
+    with store.lock:
+        if time.monotonic() - store.synced_at >= EVENT_STORE_TTL:
+            _sync(creds, store)
+        entries = list(store.events.values())
+
+    selected = [
+        entry for entry in entries
+        if (time_min is None or entry[1] > time_min) and (time_max is None or entry[0] < time_max)
+    ]
+    selected.sort(key=lambda entry: entry[0])
+    if max_results is not None:
+        selected = selected[:max_results]
+    return [entry[2] for entry in selected]
+
+def remember_event(creds, event):
+    """Write a newly created or updated event through to the store."""
+    store = _store_for(creds)
+    with store.lock:
+        _apply(store, event)
+
+def forget_event(creds, event_id):
+    """Remove a deleted event from the store."""
+    store = _store_for(creds)
+    with store.lock:
+        _discard(store, event_id)
+
+def get_fingerprints(creds):
+    """
+    Return the set of fingerprints of every stored event (see utils.fingerprints).
+
+    The index is maintained incrementally as events are synced, created and
+    deleted, so this costs one set copy and lookups against it are O(1).
+    """
+    store = _store_for(creds)
+    with store.lock:
+        if time.monotonic() - store.synced_at >= EVENT_STORE_TTL:
+            _sync(creds, store)
+        return set(store.fingerprints)
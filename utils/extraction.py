@@ -0,0 +1,211 @@
+# backend/utils/extraction.py
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+from config import LLM_BATCH_MAX_EMAILS, LLM_BATCH_CHAR_BUDGET, EXTRACTION_WORKERS
+from utils.llm import generate_content, parse_json_response
+from utils.extraction_cache import extraction_cache_key, get_cached_extraction, cache_extraction
+
+# Longest email body (in characters) included in an extraction prompt
+MAX_EMAIL_CHARS = 6000
+
+# Bounded pool running extraction batches; calls past a caller's deadline finish here (and still fill the cache)
+_executor = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix='extraction')
+
+# What to extract from each email for every extraction kind.
+# Bump "version" whenever a prompt changes so cached results are not reused.
+EXTRACTIONS = {
+    'suggestion': {
+        'version': 2,
+        'instructions': """
+        1. A task description (what needs to be done or attended)
+        2. When this task/event is happening (date and time in YYYY-MM-DD HH:MM format)
+        3. Where it's happening (location)
+        4. Is this time-sensitive? (yes/no)
+
+        If there is no clear task or the email is just informational, use "FYI: brief summary of
+        what this email is about" as the task, "none" for event_date and location, and false
+        for is_time_sensitive.
+        """,
+        'fields': """
+            "task": "task description",
+            "event_date": "YYYY-MM-DD HH:MM or none if not found",
+            "location": "location if mentioned or none",
+            "is_time_sensitive": true/false
+        """
+    },
+    'calendar_event': {
+        'version': 2,
+        'instructions': """
+        1. The SPECIFIC date and time of the event mentioned (EXACT DATE AND TIME, not relative dates)
+        2. The location of the event (if mentioned)
+        3. A brief description of what this event is about
+
+        IMPORTANT: For the event_date, you must provide the EXACT date and time in YYYY-MM-DD HH:MM format.
+        Do not use "tomorrow", "next week", or any other relative dates. Convert them to actual calendar dates.
+        """,
+        'fields': """
+            "event_date": "YYYY-MM-DD HH:MM" or "none" if not found,
+            "location": "location string or 'none' if not found",
+            "description": "brief description of the event"
+        """
+    }
+}
+
+def _format_email(email_id, email):
+    content = (email.get('content') or '')[:MAX_EMAIL_CHARS]
+    return f"""
+    ### Email ID: {email_id}
+    **Email Subject:** {email.get('subject', 'No Subject')}
+    **Email Content:** {content}
+    """
+
+def build_extraction_prompt(kind, batch):
+    """Build one prompt asking for a JSON array with one result per (email_id, email) pair."""
+    spec = EXTRACTIONS[kind]
+    emails = "\n".join(_format_email(email_id, email) for email_id, email in batch)
+    return f"""
+    For each email below, extract the following information:
+    {spec['instructions']}
+
+    Respond with ONLY a JSON array containing exactly one object per email:
+    [
+        {{
+            "email_id": "the Email ID exactly as given",
+            {spec['fields']}
+        }}
+    ]
+
+    {emails}
+    """
+
+def _pack_batches(pending):
+    """Group (email_id, email) pairs into batches bounded by count and prompt size."""
+    batches = []
+    current = []
+    current_chars = 0
+    for email_id, email in pending:
+        size = len(email.get('subject') or '') + min(len(email.get('content') or ''), MAX_EMAIL_CHARS)
+        if current and (len(current) >= LLM_BATCH_MAX_EMAILS or current_chars + size > LLM_BATCH_CHAR_BUDGET):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append((email_id, email))
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _extract_batch(kind, batch, cache_keys, results):
+    """
+    Run one batched extraction, splitting the batch in half and retrying
+    when the model output cannot be parsed or is missing some emails.
+    """
+    try:
+        response = generate_content(build_extraction_prompt(kind, batch))
+        items = parse_json_response(response.text if response and response.text else '')
+        if isinstance(items, dict):
+            items = [items]
+        items = [item for item in items if isinstance(item, dict)]
+        if len(batch) == 1 and len(items) == 1:
+            # A lone result can only belong to the lone email, even if the model dropped or garbled its ID
+            by_id = {batch[0][0]: items[0]}
+        else:
+            by_id = {str(item.get('email_id')): item for item in items}
+    except Exception as e:
+        if len(batch) == 1:
+            print(f"Could not extract {kind} from email {batch[0][0]}: {e}")
+            return
+        print(f"Batch {kind} extraction of {len(batch)} emails failed to parse, splitting: {e}")
+        middle = len(batch) // 2
+        _extract_batch(kind, batch[:middle], cache_keys, results)
+        _extract_batch(kind, batch[middle:], cache_keys, results)
+        return
+
+    unmatched = set(by_id) - {email_id for email_id, _ in batch}
+    if unmatched:
+        print(f"Ignoring {kind} results for unknown email IDs {sorted(unmatched)}")
+
+    missing = []
+    for email_id, email in batch:
+        data = by_id.get(email_id)
+        if data is None:
+            missing.append((email_id, email))
+            continue
+        data.pop('email_id', None)
+        cache_extraction(cache_keys[email_id], data)
+        results[email_id] = data
+
+    if missing and len(batch) > 1:
+        print(f"Model skipped {len(missing)} of {len(batch)} emails, retrying them")
+        middle = max(1, len(missing) // 2)
+        _extract_batch(kind, missing[:middle], cache_keys, results)
+        if missing[middle:]:
+            _extract_batch(kind, missing[middle:], cache_keys, results)
+    elif missing:
+        print(f"Model returned no {kind} for email {missing[0][0]}")
+
+def _run_batch(kind, batch, cache_keys):
+    batch_results = {}
+    _extract_batch(kind, batch, cache_keys, batch_results)
+    return batch_results
+
+def extract_from_emails(kind, emails, deadline=None, on_batch=None, user_id=None, timezone_str=None):
+    """
+    Extract structured data ("suggestion" or "calendar_event") from emails.
+
+    Cached results are reused; the rest are packed into as few prompts as
+    LLM_BATCH_MAX_EMAILS and LLM_BATCH_CHAR_BUDGET allow, and batches whose
+    output fails to parse are split adaptively. Batches run concurrently on
+    a pool of EXTRACTION_WORKERS threads. With a deadline (seconds), batches
+    still running when it passes are left out of the result; they finish in
+    the background and their results are cached for the next call.
+    on_batch, if given, is called in the caller's thread with each new
+    {email_id: data} chunk (cached results first) as soon as it is ready.
+    user_id and timezone_str scope the cache entries (see extraction_cache_key).
+
+    Returns a dict mapping each email's ID to its extracted data; emails
+    that could not be extracted (or missed the deadline) are left out.
+    """
+    spec = EXTRACTIONS[kind]
+    results = {}
+    cache_keys = {}
+    pending = []
+    for index, email in enumerate(emails):
+        email_id = str(email.get('id') or f"email-{index}")
+        cache_keys[email_id] = extraction_cache_key(
+            kind, spec['version'], message_id=email.get('id'),
+            content=f"{email.get('subject', '')}\n{email.get('content', '')}",
+            user_id=user_id, timezone_str=timezone_str
+        )
+        cached = get_cached_extraction(cache_keys[email_id])
+        if cached is not None:
+            results[email_id] = cached
+        else:
+            pending.append((email_id, email))
+
+    if on_batch and results:
+        on_batch(dict(results))
+
+    batches = _pack_batches(pending)
+    if len(batches) == 1 and deadline is None:
+        batch_results = _run_batch(kind, batches[0], cache_keys)
+        results.update(batch_results)
+        if on_batch:
+            on_batch(batch_results)
+        return results
+
+    futures = [_executor.submit(_run_batch, kind, batch, cache_keys) for batch in batches]
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            try:
+                batch_results = future.result()
+            except Exception as e:
+                print(f"Batch {kind} extraction failed: {e}")
+                continue
+            results.update(batch_results)
+            if on_batch:
+                on_batch(batch_results)
+    except TimeoutError:
+        still_running = sum(not future.done() for future in futures)
+        print(f"{still_running} of {len(batches)} {kind} batch(es) still running after {deadline}s, returning partial results")
+    return results
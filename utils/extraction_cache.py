@@ -0,0 +1,103 @@
+# backend/utils/extraction_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_TTL, EXTRACTION_CACHE_MAX_ENTRIES
+from utils.llm import DEFAULT_MODEL
+
+# One SQLite connection per thread; WAL lets the scheduler and web threads read concurrently
+_local = threading.local()
+_puts_since_eviction = 0
+_eviction_lock = threading.Lock()
+
+# Run the LRU size check every N writes instead of on every insert
+EVICTION_CHECK_INTERVAL = 50
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(EXTRACTION_CACHE_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(EXTRACTION_CACHE_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_accessed ON extractions (accessed_at)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def extraction_cache_key(kind, prompt_version, message_id=None, content=None, model_name=None,
+                         user_id=None, timezone_str=None):
+    """
+    Build a content-addressed cache key for an LLM extraction.
+
+    The key covers the extraction kind, prompt version and model name, plus
+    the Gmail message ID (messages are immutable) or, when there is no ID, a
+    hash of the content. Bumping prompt_version invalidates old results.
+    Results are scoped to the user and timezone they were extracted for:
+    resolved dates depend on the user's timezone, so identical emails sent
+    to different users must not share an entry.
+    """
+    if message_id:
+        source = f"id:{message_id}"
+    else:
+        source = "sha256:" + hashlib.sha256((content or "").encode()).hexdigest()
+    raw = f"{kind}|v{prompt_version}|{model_name or DEFAULT_MODEL}|{user_id or ''}|{timezone_str or ''}|{source}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def get_cached_extraction(key):
+    """Return the cached extraction for key, or None if missing or older than EXTRACTION_CACHE_TTL."""
+    try:
+        conn = _connection()
+        row = conn.execute("SELECT value, created_at FROM extractions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > EXTRACTION_CACHE_TTL:
+            conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return json.loads(row[0])
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Extraction cache read failed: {e}")
+        return None
+
+def cache_extraction(key, value):
+    """Store a JSON-serializable extraction result, evicting least recently used entries when full."""
+    global _puts_since_eviction
+    try:
+        conn = _connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO extractions (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now)
+        )
+        conn.commit()
+        with _eviction_lock:
+            _puts_since_eviction += 1
+            if _puts_since_eviction < EVICTION_CHECK_INTERVAL:
+                return
+            _puts_since_eviction = 0
+        conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - EXTRACTION_CACHE_TTL,))
+        count = conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        if count > EXTRACTION_CACHE_MAX_ENTRIES:
+            conn.execute(
+                "DELETE FROM extractions WHERE key IN "
+                "(SELECT key FROM extractions ORDER BY accessed_at LIMIT ?)",
+                (count - EXTRACTION_CACHE_MAX_ENTRIES,)
+            )
+        conn.commit()
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        print(f"Extraction cache write failed: {e}")
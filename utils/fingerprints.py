@@ -0,0 +1,69 @@
+# backend/utils/fingerprints.py
+import hashlib
+import re
+
+# Keys RunDown writes into extendedProperties.private of the events it creates
+SOURCE_ID_KEY = 'rundownSourceId'
+TITLE_HASH_KEY = 'rundownTitleHash'
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalize_title(title):
+    """Lowercase a title and collapse punctuation/whitespace so trivial edits still match."""
+    return _NON_WORD.sub(' ', (title or '').lower()).strip()
+
+def title_hash(title):
+    """Short stable hash of a normalized title, or None for an empty title."""
+    normalized = normalize_title(title)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+def source_fingerprint(source_id):
+    """Fingerprint for the email (message ID) an event was created from."""
+    return f"src:{source_id}" if source_id else None
+
+def title_fingerprint(title):
+    """Fingerprint for an event or task title."""
+    digest = title_hash(title)
+    return f"title:{digest}" if digest else None
+
+def fingerprint_properties(title, source_id=None):
+    """extendedProperties.private entries identifying a RunDown-created event."""
+    properties = {}
+    digest = title_hash(title)
+    if digest:
+        properties[TITLE_HASH_KEY] = digest
+    if source_id:
+        properties[SOURCE_ID_KEY] = str(source_id)
+    return properties
+
+def event_fingerprints(event):
+    """
+    Every fingerprint an event is known by.
+
+    Uses the private extended properties RunDown stores on creation, plus
+    the event's current title. Events created before fingerprints existed
+    fall back to the "Email ID:" and "Subject:" lines of their description.
+    """
+    fingerprints = set()
+    private = (event.get('extendedProperties') or {}).get('private') or {}
+    if private.get(SOURCE_ID_KEY):
+        fingerprints.add(source_fingerprint(private[SOURCE_ID_KEY]))
+    if private.get(TITLE_HASH_KEY):
+        fingerprints.add(f"title:{private[TITLE_HASH_KEY]}")
+    summary_fingerprint = title_fingerprint(event.get('summary'))
+    if summary_fingerprint:
+        fingerprints.add(summary_fingerprint)
+
+    if not private:
+        for line in (event.get('description') or '').split('\n'):
+            if line.startswith('Email ID:'):
+                legacy = source_fingerprint(line[len('Email ID:'):].strip())
+            elif line.startswith('Subject:'):
+                legacy = title_fingerprint(line[len('Subject:'):])
+            else:
+                continue
+            if legacy:
+                fingerprints.add(legacy)
+    return fingerprints
@@ -2,9 +2,9 @@
 import os
 import base64
 from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
-from utils.auth import get_flow, save_credentials, load_credentials
-from google.auth.transport.requests import Request
+from utils.auth import get_valid_credentials
+from utils.services import get_service, execute_batch
+from config import FULL_SYNC_MAX_MESSAGES
 
 
 def ensure_label_exists(service, label_name):
@@ -31,19 +31,147 @@ def get_email_details(service, email_id):
     """Fetch email details including subject, sender, and content."""
     try:
         message = service.users().messages().get(userId='me', id=email_id, format='full').execute()
-        headers = message.get('payload', {}).get('headers', [])
-        subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-        sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown Sender')
-        email_body = extract_email_body(message.get('payload', {}))
-        return {
-            'id': email_id,
-            'subject': subject,
-            'sender': sender,
-            'content': email_body
-        }
+        return parse_email_details(message)
     except Exception as e:
         return {'error': str(e)}
 
+def parse_email_details(message):
+    """Extract subject, sender, and content from a full Gmail message resource."""
+    headers = message.get('payload', {}).get('headers', [])
+    subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
+    sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown Sender')
+    email_body = extract_email_body(message.get('payload', {}))
+    return {
+        'id': message.get('id'),
+        'subject': subject,
+        'sender': sender,
+        'content': email_body
+    }
+
+def batch_get_messages(service, message_ids, format='full', failed_ids=None):
+    """
+    Fetch several messages in one round trip per batch of up to 50 messages.
+
+    Items that fail inside the batch are retried with individual
+    ``messages().get`` calls. Returns a dict mapping message ID to the
+    message resource; messages that could not be fetched are omitted.
+    If failed_ids (a set) is given, the IDs that could not be fetched for
+    any reason other than the message being gone (HTTP 404) are added to it.
+    """
+    requests = [
+        (msg_id, service.users().messages().get(userId='me', id=msg_id, format=format))
+        for msg_id in message_ids
+    ]
+    messages, failed = execute_batch(service, requests)
+    for msg_id in failed:
+        try:
+            messages[msg_id] = service.users().messages().get(
+                userId='me', id=msg_id, format=format
+            ).execute()
+        except Exception as e:
+            print(f"Failed to fetch message {msg_id}: {e}")
+            if failed_ids is not None and not (isinstance(e, HttpError) and e.resp.status == 404):
+                failed_ids.add(msg_id)
+    return messages
+
+def batch_modify_messages(service, message_ids, body):
+    """
+    Apply the same label modification to several messages via the batch endpoint.
+
+    Items that fail inside the batch are retried individually. Returns the
+    list of message IDs that were modified.
+    """
+    requests = [
+        (msg_id, service.users().messages().modify(userId='me', id=msg_id, body=body))
+        for msg_id in message_ids
+    ]
+    modified, failed = execute_batch(service, requests)
+    modified = list(modified)
+    for msg_id in failed:
+        try:
+            service.users().messages().modify(userId='me', id=msg_id, body=body).execute()
+            modified.append(msg_id)
+        except Exception as e:
+            print(f"Failed to modify message {msg_id}: {e}")
+    return modified
+
+def list_history_message_ids(service, start_history_id, exclude_label_ids=()):
+    """
+    List messages added to the mailbox since start_history_id.
+
+    Returns a (message_ids, latest_history_id) tuple, or None if the
+    checkpoint is too old for Gmail to serve (HTTP 404), in which case the
+    caller must perform a full resync. Drafts, spam, trash and messages
+    carrying any of exclude_label_ids are skipped, matching what the full
+    resync search returns.
+    """
+    skip_labels = {'DRAFT', 'SPAM', 'TRASH', *exclude_label_ids}
+    message_ids = []
+    seen = set()
+    latest_history_id = start_history_id
+    page_token = None
+    try:
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added.get('message', {})
+                    msg_id = message.get('id')
+                    if not msg_id or msg_id in seen:
+                        continue
+                    if skip_labels.intersection(message.get('labelIds', [])):
+                        continue
+                    seen.add(msg_id)
+                    message_ids.append(msg_id)
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+    except HttpError as error:
+        if error.resp.status == 404:
+            print(f"History checkpoint {start_history_id} has expired")
+            return None
+        raise
+    return message_ids, latest_history_id
+
+def list_message_ids(service, query, max_results):
+    """List up to max_results message IDs matching a Gmail search query, following pagination."""
+    message_ids = []
+    page_token = None
+    while len(message_ids) < max_results:
+        response = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=min(max_results - len(message_ids), 500),
+            pageToken=page_token
+        ).execute()
+        message_ids.extend(msg['id'] for msg in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    return message_ids[:max_results]
+
+def sync_message_ids(service, history_id, query, exclude_label_ids=(), max_results=FULL_SYNC_MAX_MESSAGES):
+    """
+    Find messages to process since the last sync checkpoint.
+
+    Uses users.history.list when a history_id checkpoint is available, and
+    falls back to a full resync with the search query when there is no
+    checkpoint or it has expired. Returns (message_ids, new_history_id).
+    """
+    if history_id:
+        result = list_history_message_ids(service, history_id, exclude_label_ids)
+        if result is not None:
+            return result
+    # Read the current historyId before listing so nothing arriving in between is missed
+    new_history_id = service.users().getProfile(userId='me').execute().get('historyId')
+    return list_message_ids(service, query, max_results), new_history_id
+
 def extract_email_body(payload):
     """Extract the email body from the payload."""
     if 'parts' in payload:
@@ -75,16 +203,12 @@ def fetch_emails(user_id, days=7):
     Returns:
         List of email objects with id, subject, content, and date
     """
-    creds = load_credentials(user_id)
+    creds = get_valid_credentials(user_id)
     if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            save_credentials(user_id, creds)
-        else:
-            return None  # Handle this case properly in your application
+        return None  # Handle this case properly in your application
 
     try:
-        service = build('gmail', 'v1', credentials=creds)
+        service = get_service('gmail', 'v1', creds)
         
         # Calculate the date range based on the days parameter
         from datetime import datetime, timedelta
@@ -100,7 +224,12 @@ def fetch_emails(user_id, days=7):
             q=query
         ).execute().get('messages', [])
         
-        return [get_email_details(service, msg['id']) for msg in messages]
+        fetched = batch_get_messages(service, [msg['id'] for msg in messages])
+        return [
+            parse_email_details(fetched[msg['id']]) if msg['id'] in fetched
+            else {'error': f"Failed to fetch message {msg['id']}"}
+            for msg in messages
+        ]
     except Exception as e:
         print(f"Error fetching emails: {str(e)}")
         return {'error': str(e)}
\ No newline at end of file
@@ -0,0 +1,129 @@
+# backend/utils/jobs.py
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+
+from config import JOB_WORKERS, JOB_RESULT_TTL
+from utils.ttl_store import TTLStore
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Background work started from HTTP requests (e.g. suggestion jobs)
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='jobs')
+
+# Jobs that have not finished never expire: job id -> Job, and (user_id, key) -> job id so
+# identical requests share a job. Finished jobs move to the TTL stores below.
+_active = {}
+_active_ids = {}
+_jobs = TTLStore(JOB_RESULT_TTL)
+_job_ids = TTLStore(JOB_RESULT_TTL)
+_start_lock = threading.Lock()
+
+class Job:
+    """State of one background job: status, progress counters and (partial) result."""
+
+    def __init__(self, user_id, key):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.key = key
+        self.status = PENDING
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._lock = threading.Lock()
+
+    def update(self, result=None, **progress):
+        """Record progress and, optionally, the partial result produced so far."""
+        with self._lock:
+            self.progress.update(progress)
+            if result is not None:
+                self.result = result
+            self.updated_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at
+            }
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self.status = status
+            if result is not None:
+                self.result = result
+            self.error = error
+            self.updated_at = time.time()
+        # Keep finished results around for JOB_RESULT_TTL seconds from completion
+        with _start_lock:
+            _jobs.set(self.id, self)
+            _job_ids.set((self.user_id, self.key), self.id)
+            _active.pop(self.id, None)
+            if _active_ids.get((self.user_id, self.key)) == self.id:
+                del _active_ids[(self.user_id, self.key)]
+
+def _run(job, app, func, args, kwargs):
+    def work():
+        with job._lock:
+            job.status = RUNNING
+        try:
+            job._finish(DONE, result=func(job, *args, **kwargs))
+        except Exception as e:
+            print(f"Job {job.id} ({job.key}) failed: {e}")
+            print(traceback.format_exc())
+            job._finish(FAILED, error=str(e))
+
+    if app is None:
+        work()
+    else:
+        with app.app_context():
+            work()
+
+def start_job(user_id, key, func, *args, restart=False, **kwargs):
+    """
+    Run func(job, *args, **kwargs) in the background and return (job, created).
+
+    A job that already exists for (user_id, key) is returned instead of
+    starting a new one, unless restart=True and it has finished. Running
+    jobs are kept until they finish; finished jobs and their results are
+    kept for JOB_RESULT_TTL seconds after completion.
+    """
+    with _start_lock:
+        active_id = _active_ids.get((user_id, key))
+        if active_id:
+            return _active[active_id], False
+        existing_id = _job_ids.get((user_id, key))
+        existing = _jobs.get(existing_id) if existing_id else None
+        if existing and not restart:
+            return existing, False
+
+        job = Job(user_id, key)
+        _active[job.id] = job
+        _active_ids[(user_id, key)] = job.id
+
+    app = current_app._get_current_object() if has_app_context() else None
+    _executor.submit(_run, job, app, func, args, kwargs)
+    return job, True
+
+def get_job(job_id, user_id):
+    """Return the job if it exists and belongs to user_id, else None."""
+    with _start_lock:
+        job = _active.get(job_id)
+    if job is None:
+        job = _jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
@@ -0,0 +1,63 @@
+# backend/utils/llm.py
+import os
+import json
+import threading
+import google.generativeai as genai
+
+from config import GOOGLE_API_KEY, LLM_MAX_CONCURRENCY
+
+DEFAULT_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
+
+genai.configure(api_key=GOOGLE_API_KEY)
+
+# Model name -> GenerativeModel, shared by every request and scheduler thread
+_models = {}
+_models_lock = threading.Lock()
+
+# Caps the number of Gemini calls in flight; extra callers block until a slot frees up
+_call_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+def get_model(model_name=None):
+    """Return a shared GenerativeModel instance for model_name (default: GEMINI_MODEL)."""
+    model_name = model_name or DEFAULT_MODEL
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _models[model_name] = model
+        return model
+
+def generate_content(prompt, model_name=None, **kwargs):
+    """Run generate_content on a shared model, queueing when LLM_MAX_CONCURRENCY calls are in flight."""
+    model = get_model(model_name)
+    with _call_slots:
+        return model.generate_content(prompt, **kwargs)
+
+def stream_content(prompt, model_name=None, **kwargs):
+    """
+    Yield the text of a streamed generate_content call as chunks arrive.
+
+    The concurrency slot is held until the stream is exhausted or the
+    generator is closed (e.g. the client disconnected).
+    """
+    model = get_model(model_name)
+    with _call_slots:
+        for chunk in model.generate_content(prompt, stream=True, **kwargs):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without a text part (e.g. only finish or safety metadata)
+                continue
+            if text:
+                yield text
+
+def parse_json_response(response_text):
+    """Parse a JSON object from a model response, stripping Markdown code fences if present."""
+    response_text = response_text.strip()
+    if "```json" in response_text:
+        json_str = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        json_str = response_text.split("```")[1].strip()
+    else:
+        json_str = response_text
+    return json.loads(json_str)
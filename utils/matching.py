@@ -0,0 +1,86 @@
+# backend/utils/matching.py
+import re
+import threading
+
+# user_id -> InterestMatcher, rebuilt whenever the user's interests change
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+def _word_pattern(word, stem, vocabulary=()):
+    """
+    Regex for one interest word, optionally matching simple plural variants.
+
+    The word itself is always required; only extra plural suffixes are
+    optional. A trailing "s" is dropped only when the shorter form is also
+    one of the user's interest words (vocabulary), so "News" never matches
+    "new" and "Physics" never matches "physic".
+    """
+    if not stem or len(word) <= 3 or not word.isalpha():
+        return re.escape(word)
+    if word.endswith('ies'):
+        return re.escape(word[:-3]) + r'(?:y|ies)'
+    if word.endswith('y') and word[-2] not in 'aeiou':
+        return re.escape(word[:-1]) + r'(?:y|ies)'
+    if word.endswith('s'):
+        if word[:-1] in vocabulary:
+            return re.escape(word[:-1]) + r'(?:s|es)?'
+        return re.escape(word) + r'(?:es)?'
+    return re.escape(word) + r'(?:s|es)?'
+
+class InterestMatcher:
+    """Matches text against a list of interests using a single compiled regex.
+
+    Each interest becomes a word-boundary alternative, with multi-word
+    interests allowing any punctuation/whitespace between words. With
+    stemming enabled "Event" also matches "events" and
+    "Volunteer Opportunities" matches "volunteer opportunity".
+
+    >>> InterestMatcher(['News']).matches('new email')
+    []
+    >>> InterestMatcher(['News', 'Sports']).matches('Campus news: sport results')
+    ['News']
+    >>> InterestMatcher(['Volunteer Opportunities']).search('A volunteer opportunity')
+    'Volunteer Opportunities'
+    """
+    
+    def __init__(self, interests, stem=True):
+        self.interests = tuple(interests)
+        alternatives = []
+        # Longer interests first so "Cultural Events" wins over a shorter overlapping interest
+        order = sorted(range(len(self.interests)), key=lambda i: len(self.interests[i]), reverse=True)
+        vocabulary = {word for interest in self.interests for word in re.findall(r'\w+', interest.lower())}
+        for index in order:
+            words = re.findall(r'\w+', self.interests[index].lower())
+            if words:
+                # Words may be separated by any punctuation, and "&" may be written as "and"
+                pattern = r'\W+(?:and\W+)?'.join(_word_pattern(word, stem, vocabulary) for word in words)
+                alternatives.append(rf'(?P<i{index}>\b{pattern}\b)')
+        self._regex = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+    
+    def search(self, text):
+        """Return the first interest found in text, or None."""
+        if self._regex is None or not text:
+            return None
+        match = self._regex.search(text)
+        return self.interests[int(match.lastgroup[1:])] if match else None
+    
+    def matches(self, text):
+        """Return every interest found in text, in the user's order."""
+        if self._regex is None or not text:
+            return []
+        found = set()
+        for match in self._regex.finditer(text):
+            found.add(int(match.lastgroup[1:]))
+            if len(found) == len(self.interests):
+                break
+        return [self.interests[i] for i in sorted(found)]
+
+def get_interest_matcher(user_id, interests):
+    """Return the cached matcher for a user, recompiling it if their interests changed."""
+    interests = tuple(interests)
+    with _matchers_lock:
+        matcher = _matchers.get(user_id)
+        if matcher is None or matcher.interests != interests:
+            matcher = InterestMatcher(interests)
+            _matchers[user_id] = matcher
+        return matcher
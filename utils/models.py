@@ -1,40 +1,105 @@
 from flask import session
-import os
-import json
-from config import TOKENS_DIR
+import copy
+import threading
+import time
+from collections import OrderedDict
+from utils import storage
+from config import PREFERENCES_CACHE_SIZE, PREFERENCES_REVALIDATE_SECONDS
+
+# user_id -> (preferences, stored version or None, monotonic time last validated), most recently used last
+_preferences_cache = OrderedDict()
+_preferences_lock = threading.Lock()
 
 class UserPreferences:
-    """Manages user preferences for email filtering and task suggestions."""
+    """Manages user preferences for email filtering and task suggestions.
+
+    Preferences are cached in process and written through on every change.
+    A cached copy is served without touching the database for
+    PREFERENCES_REVALIDATE_SECONDS; after that only its version number is
+    re-checked, so edits from other processes are picked up promptly.
+    """
     
-    @staticmethod
-    def get_preferences_path(user_id):
-        """Get the path to the user's preferences file."""
-        return os.path.join(TOKENS_DIR, f"{user_id}_preferences.json")
+    DEFAULTS = {
+        "interests": [],
+        "enabled": True
+    }
     
     @staticmethod
     def save_preferences(user_id, preferences):
-        """Save user preferences to a file."""
-        preferences_path = UserPreferences.get_preferences_path(user_id)
-        with open(preferences_path, 'w') as f:
-            json.dump(preferences, f)
+        """Replace the user's stored preferences."""
+        version = storage.put_preferences(user_id, preferences)
+        UserPreferences._cache(user_id, preferences, version)
     
     @staticmethod
     def load_preferences(user_id):
-        """Load user preferences from a file."""
-        preferences_path = UserPreferences.get_preferences_path(user_id)
-        if not os.path.exists(preferences_path):
-            # Default preferences
-            return {
-                "interests": [],
-                "enabled": True
-            }
-        with open(preferences_path, 'r') as f:
-            return json.load(f)
+        """Load user preferences, or the defaults if none are stored.
+
+        Returns a copy, so callers may modify it freely.
+        """
+        now = time.monotonic()
+        with _preferences_lock:
+            cached = _preferences_cache.get(user_id)
+            if cached and now - cached[2] < PREFERENCES_REVALIDATE_SECONDS:
+                _preferences_cache.move_to_end(user_id)
+                return copy.deepcopy(cached[0])
+
+        if cached and storage.get_preferences_version(user_id) == cached[1]:
+            UserPreferences._cache(user_id, cached[0], cached[1])
+            return copy.deepcopy(cached[0])
+
+        stored = storage.get_preferences(user_id)
+        preferences, version = stored if stored else (dict(UserPreferences.DEFAULTS), None)
+        UserPreferences._cache(user_id, preferences, version)
+        return copy.deepcopy(preferences)
     
     @staticmethod
     def update_preferences(user_id, new_preferences):
-        """Update existing user preferences."""
-        current_preferences = UserPreferences.load_preferences(user_id)
-        current_preferences.update(new_preferences)
-        UserPreferences.save_preferences(user_id, current_preferences)
-        return current_preferences 
\ No newline at end of file
+        """Merge changes into the user's preferences atomically."""
+        preferences, version = storage.update_preferences(user_id, new_preferences, UserPreferences.DEFAULTS)
+        UserPreferences._cache(user_id, preferences, version)
+        return copy.deepcopy(preferences)
+    
+    @staticmethod
+    def _cache(user_id, preferences, version):
+        """Store preferences in the LRU cache, evicting the least recently used users."""
+        with _preferences_lock:
+            current = _preferences_cache.get(user_id)
+            # Never replace a newer version that another thread cached first
+            if current and version is not None and current[1] is not None and current[1] > version:
+                return
+            _preferences_cache[user_id] = (copy.deepcopy(preferences), version, time.monotonic())
+            _preferences_cache.move_to_end(user_id)
+            while len(_preferences_cache) > PREFERENCES_CACHE_SIZE:
+                _preferences_cache.popitem(last=False)
+
+class SyncCheckpoint:
+    """Stores the last processed Gmail historyId for each user."""
+    
+    @staticmethod
+    def load_history_id(user_id):
+        """Return the stored historyId, or None if the user has never been synced."""
+        return storage.get_history_id(user_id)
+    
+    @staticmethod
+    def save_history_id(user_id, history_id):
+        """Persist the historyId reached by the latest successful sync."""
+        storage.put_history_id(user_id, history_id)
+
+class ProcessedMessages:
+    """Ledger of Gmail messages that already produced (or were deliberately skipped for) an event."""
+    
+    @staticmethod
+    def already_processed(user_id, message_ids):
+        """Return the subset of message_ids recorded for this user."""
+        return storage.processed_message_ids(user_id, message_ids)
+    
+    @staticmethod
+    def record(user_id, message_ids):
+        """Record messages as processed so later syncs never create a second event for them."""
+        if message_ids:
+            storage.record_processed_messages(user_id, message_ids)
+    
+    @staticmethod
+    def prune(max_age_seconds):
+        """Forget entries older than max_age_seconds across all users."""
+        return storage.prune_processed_messages(max_age_seconds)
@@ -0,0 +1,118 @@
+# backend/utils/services.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, build_http
+
+from config import SERVICE_CACHE_SIZE, SERVICE_CACHE_TTL
+
+# Maximum number of calls per batch request (Google recommends <= 50)
+BATCH_SIZE = 50
+
+# (api_name, version, credential identity) -> (service, created_at, current credentials holder)
+_services = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# One httplib2 transport per thread, shared by every cached service used on that thread
+_http_local = threading.local()
+
+def _thread_http():
+    """Return this thread's httplib2 transport; httplib2 connections must not be shared across threads."""
+    http = getattr(_http_local, 'http', None)
+    if http is None:
+        http = _http_local.http = build_http()
+    return http
+
+def _request_builder(holder):
+    """
+    Build each API request on the calling thread's transport, so one service object can serve every thread.
+
+    Requests are authorized with holder[0], the credentials most recently passed to get_service for this
+    client, so a token refreshed (and saved) elsewhere is picked up instead of the one the client was built with.
+    """
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(AuthorizedHttp(holder[0], http=_thread_http()), *args, **kwargs)
+    return build_request
+
+def credential_identity(creds):
+    """Return a stable key for a user's credentials that survives access token refreshes."""
+    secret = creds.refresh_token or creds.token or ""
+    return hashlib.sha256(f"{creds.client_id}:{secret}".encode()).hexdigest()
+
+def get_service(api_name, version, creds):
+    """
+    Return a Google API service object, reusing a cached one when possible.
+
+    Building a service parses the discovery document, so clients are cached
+    per credential identity with an LRU bound (SERVICE_CACHE_SIZE) and a TTL
+    (SERVICE_CACHE_TTL seconds). httplib2 transports are not thread-safe, so
+    a cached client is shared by all threads but every request it builds
+    runs on the calling thread's own transport. Each call hands the cached
+    client the caller's credentials (the current ones from utils.auth), so
+    it never keeps using a stale token that would then be refreshed outside
+    the single-flight refresh lock.
+    """
+    key = (api_name, version, credential_identity(creds))
+    now = time.monotonic()
+    with _lock:
+        entry = _services.get(key)
+        if entry and now - entry[1] < SERVICE_CACHE_TTL:
+            entry[2][0] = creds
+            _services.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[0]
+        _stats["misses"] += 1
+
+    holder = [creds]
+    service = build(api_name, version, http=AuthorizedHttp(creds, http=_thread_http()),
+                    requestBuilder=_request_builder(holder), cache_discovery=False)
+
+    with _lock:
+        _services[key] = (service, now, holder)
+        _services.move_to_end(key)
+        while len(_services) > SERVICE_CACHE_SIZE:
+            _services.popitem(last=False)
+            _stats["evictions"] += 1
+    return service
+
+def service_cache_stats():
+    """Return cache hit/miss counters and the current cache size."""
+    with _lock:
+        return dict(_stats, size=len(_services))
+
+def execute_batch(service, requests, batch_size=BATCH_SIZE):
+    """
+    Execute (request_id, request) pairs through the service's batch endpoint.
+
+    Returns a (responses, errors) tuple of dicts keyed by request ID; errors
+    holds the exception for every item that failed. Requests are sent in
+    chunks of batch_size; a whole chunk counts as failed if the batch call
+    itself raises.
+    """
+    responses = {}
+    errors = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            print(f"Batch item {request_id} failed: {exception}")
+            errors[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    for i in range(0, len(requests), batch_size):
+        chunk = requests[i:i + batch_size]
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"Batch request failed: {e}")
+            for request_id, _ in chunk:
+                if request_id not in responses and request_id not in errors:
+                    errors[request_id] = e
+    return responses, errors
@@ -0,0 +1,111 @@
+# backend/utils/sessions.py
+import secrets
+import time
+from flask import current_app, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+from utils import storage
+
+class SqliteSession(SecureCookieSession):
+    """Session whose data lives in the storage database; the cookie only carries its signed ID."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.expires_at = expires_at
+
+class SqliteSessionInterface(SessionInterface):
+    """
+    Server-side sessions stored as rows in the SQLite storage database.
+
+    A row is written only when the session changes, or when a permanent
+    session is past half its lifetime and needs its expiry pushed back, so
+    ordinary requests cost one indexed read. Expired rows are removed by
+    prune_expired().
+    """
+
+    serializer = TaggedJSONSerializer()
+    session_class = SqliteSession
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='rundown-session')
+
+    def regenerate(self, session):
+        """Move the session to a fresh ID and delete the old row (prevents session fixation)."""
+        storage.delete_session(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        session.expires_at = None
+        session.modified = True
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            stored = storage.get_session(sid) if sid else None
+            if stored:
+                data, expires_at = stored
+                return self.session_class(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # Emptied (e.g. logout): drop the row and the cookie
+            if session.modified:
+                storage.delete_session(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        lifetime = self._lifetime(app)
+        refresh = (
+            session.permanent
+            and self.should_set_cookie(app, session)
+            and (session.expires_at is None or session.expires_at - now < lifetime / 2)
+        )
+        if not (session.modified or refresh):
+            return
+
+        session.expires_at = now + lifetime
+        storage.put_session(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+def regenerate_session():
+    """
+    Give the current session a new ID, keeping its data. Call on login.
+
+    Server-side backends (sqlite, and Flask-Session versions that support
+    it) get a fresh ID and the old one is discarded. Signed-cookie sessions
+    need nothing: the whole cookie is reissued when the session changes.
+    """
+    regenerate = getattr(current_app.session_interface, 'regenerate', None)
+    if regenerate is not None:
+        regenerate(session)
+
+def prune_expired():
+    """Background job: delete expired session rows."""
+    removed = storage.prune_sessions()
+    if removed:
+        print(f"Pruned {removed} expired session(s)")
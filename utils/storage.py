@@ -0,0 +1,337 @@
+# backend/utils/storage.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import STORAGE_PATH, TOKENS_DIR
+
+# One SQLite connection per thread; WAL lets the scheduler and web threads read while one writes
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS credentials (
+        user_id TEXT PRIMARY KEY,
+        data BLOB NOT NULL,              -- Fernet-encrypted authorized-user JSON
+        version INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS preferences (
+        user_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,              -- JSON object
+        version INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sync_checkpoints (
+        user_id TEXT PRIMARY KEY,
+        history_id TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS processed_messages (
+        user_id TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        processed_at REAL NOT NULL,
+        PRIMARY KEY (user_id, message_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_processed_messages_at ON processed_messages (processed_at);
+    CREATE TABLE IF NOT EXISTS sessions (
+        sid TEXT PRIMARY KEY,
+        data TEXT NOT NULL,              -- Flask tagged-JSON session payload
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
+    CREATE TABLE IF NOT EXISTS conversation_state (
+        user_id TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,             -- JSON value
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (user_id, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_conversation_state_expires_at ON conversation_state (expires_at);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+"""
+
+def _connect():
+    os.makedirs(os.path.dirname(STORAGE_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(STORAGE_PATH, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _connection():
+    global _initialized
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(_SCHEMA)
+                migrate_tokens_dir(conn)
+                _initialized = True
+    return conn
+
+@contextmanager
+def _transaction():
+    """Run statements atomically; BEGIN IMMEDIATE takes the write lock up front so read-modify-write is safe."""
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def migrate_tokens_dir(conn=None):
+    """
+    One-shot import of the legacy per-user files in TOKENS_DIR.
+
+    Reads <id>.json (encrypted credentials), <id>_preferences.json and
+    <id>_sync.json. Rows that already exist in the database win. The files
+    are left in place. Runs once per database; a 'tokens_dir_migrated' row
+    in meta records that it has happened.
+    """
+    conn = conn or _connection()
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'tokens_dir_migrated'").fetchone():
+        return
+    counts = {"credentials": 0, "preferences": 0, "sync_checkpoints": 0}
+    now = time.time()
+    names = os.listdir(TOKENS_DIR) if os.path.isdir(TOKENS_DIR) else []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(TOKENS_DIR, name)
+            stem = name[:-len('.json')]
+            try:
+                if stem.endswith('_preferences'):
+                    with open(path, 'r') as f:
+                        data = json.load(f)
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO preferences (user_id, data, version, updated_at) VALUES (?, ?, 1, ?)",
+                        (stem[:-len('_preferences')], json.dumps(data), now)
+                    )
+                    counts["preferences"] += cursor.rowcount
+                elif stem.endswith('_sync'):
+                    with open(path, 'r') as f:
+                        history_id = json.load(f).get('history_id')
+                    if history_id:
+                        cursor = conn.execute(
+                            "INSERT OR IGNORE INTO sync_checkpoints (user_id, history_id, updated_at) VALUES (?, ?, ?)",
+                            (stem[:-len('_sync')], str(history_id), now)
+                        )
+                        counts["sync_checkpoints"] += cursor.rowcount
+                else:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO credentials (user_id, data, version, updated_at) VALUES (?, ?, 1, ?)",
+                        (stem, data, now)
+                    )
+                    counts["credentials"] += cursor.rowcount
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Skipping unreadable legacy file {path}: {e}")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tokens_dir_migrated', ?)", (str(now),))
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    if any(counts.values()):
+        print(f"Migrated legacy files from {TOKENS_DIR} into {STORAGE_PATH}: {counts}")
+
+# --- credentials -----------------------------------------------------------
+
+def get_credentials(user_id):
+    """Return (encrypted_blob, version) for a user, or None."""
+    row = _connection().execute(
+        "SELECT data, version FROM credentials WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return (bytes(row[0]), row[1]) if row else None
+
+def get_credentials_version(user_id):
+    """Return the version of a user's stored credentials (bumped on every write), or None."""
+    row = _connection().execute(
+        "SELECT version FROM credentials WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+def put_credentials(user_id, data):
+    """Store a user's encrypted credentials and return the new version."""
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO credentials (user_id, data, version, updated_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, "
+            "version = credentials.version + 1, updated_at = excluded.updated_at",
+            (user_id, data, time.time())
+        )
+        return conn.execute("SELECT version FROM credentials WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def delete_credentials(user_id):
+    """Remove a user's stored credentials."""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+def list_user_ids():
+    """Return the IDs of all users with stored credentials."""
+    return [row[0] for row in _connection().execute("SELECT user_id FROM credentials ORDER BY user_id")]
+
+# --- preferences -----------------------------------------------------------
+
+def get_preferences(user_id):
+    """Return (preferences dict, version) for a user, or None if none are stored."""
+    row = _connection().execute(
+        "SELECT data, version FROM preferences WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return (json.loads(row[0]), row[1]) if row else None
+
+def get_preferences_version(user_id):
+    """Return the version of a user's stored preferences (bumped on every write), or None."""
+    row = _connection().execute(
+        "SELECT version FROM preferences WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+def put_preferences(user_id, preferences):
+    """Replace a user's preferences and return the new version."""
+    with _transaction() as conn:
+        return _write_preferences(conn, user_id, preferences)
+
+def update_preferences(user_id, changes, defaults=None):
+    """
+    Merge changes into a user's preferences in one transaction.
+
+    Starts from defaults when nothing is stored. Returns (preferences, version).
+    """
+    with _transaction() as conn:
+        row = conn.execute("SELECT data FROM preferences WHERE user_id = ?", (user_id,)).fetchone()
+        preferences = json.loads(row[0]) if row else dict(defaults or {})
+        preferences.update(changes)
+        return preferences, _write_preferences(conn, user_id, preferences)
+
+def _write_preferences(conn, user_id, preferences):
+    conn.execute(
+        "INSERT INTO preferences (user_id, data, version, updated_at) VALUES (?, ?, 1, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, "
+        "version = preferences.version + 1, updated_at = excluded.updated_at",
+        (user_id, json.dumps(preferences), time.time())
+    )
+    return conn.execute("SELECT version FROM preferences WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+# --- Gmail sync checkpoints ------------------------------------------------
+
+def get_history_id(user_id):
+    """Return the stored Gmail historyId for a user, or None."""
+    row = _connection().execute(
+        "SELECT history_id FROM sync_checkpoints WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+def put_history_id(user_id, history_id):
+    """Store the Gmail historyId reached by a user's latest sync."""
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_checkpoints (user_id, history_id, updated_at) VALUES (?, ?, ?)",
+            (user_id, str(history_id), time.time())
+        )
+
+# --- processed-message ledger ----------------------------------------------
+
+def processed_message_ids(user_id, message_ids):
+    """Return the subset of message_ids already recorded as processed for a user."""
+    message_ids = list(message_ids)
+    found = set()
+    conn = _connection()
+    # Stay well below SQLite's bound-parameter limit
+    for i in range(0, len(message_ids), 500):
+        chunk = message_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f"SELECT message_id FROM processed_messages WHERE user_id = ? AND message_id IN ({placeholders})",
+            [user_id, *chunk]
+        ))
+    return found
+
+def record_processed_messages(user_id, message_ids):
+    """Add messages to a user's processed-message ledger."""
+    now = time.time()
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO processed_messages (user_id, message_id, processed_at) VALUES (?, ?, ?)",
+            [(user_id, message_id, now) for message_id in message_ids]
+        )
+
+def prune_processed_messages(max_age_seconds):
+    """Forget ledger entries older than max_age_seconds; returns the number removed."""
+    with _transaction() as conn:
+        return conn.execute(
+            "DELETE FROM processed_messages WHERE processed_at < ?", (time.time() - max_age_seconds,)
+        ).rowcount
+
+# --- Flask sessions (SESSION_BACKEND=sqlite) -------------------------------
+
+def get_session(sid):
+    """Return (data, expires_at) for a session that has not expired, or None."""
+    row = _connection().execute(
+        "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+def put_session(sid, data, expires_at):
+    """Create or replace a session row."""
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+            (sid, data, expires_at)
+        )
+
+def delete_session(sid):
+    """Remove a session row."""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+def prune_sessions():
+    """Delete expired sessions; returns the number removed."""
+    with _transaction() as conn:
+        return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+# --- chat follow-up state ----------------------------------------------------
+
+def put_conversation_values(user_id, values, ttl):
+    """Store follow-up values for a user, each expiring ttl seconds from now."""
+    expires_at = time.time() + ttl
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO conversation_state (user_id, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            [(user_id, key, json.dumps(value), expires_at) for key, value in values.items()]
+        )
+
+def take_conversation_value(user_id, key):
+    """Remove a user's follow-up value and return it (None if missing or expired), atomically."""
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT value, expires_at FROM conversation_state WHERE user_id = ? AND key = ?", (user_id, key)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM conversation_state WHERE user_id = ? AND key = ?", (user_id, key))
+        return json.loads(row[0]) if row[1] > time.time() else None
+
+def delete_conversation_state(user_id):
+    """Remove all of a user's follow-up values."""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+
+def prune_conversation_state():
+    """Delete expired follow-up values; returns the number removed."""
+    with _transaction() as conn:
+        return conn.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (time.time(),)).rowcount
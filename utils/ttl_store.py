@@ -0,0 +1,50 @@
+# backend/utils/ttl_store.py
+import threading
+import time
+from collections import OrderedDict
+
+class TTLStore:
+    """
+    Thread-safe in-memory key/value store whose entries expire.
+
+    Each set() restarts an entry's lifetime. Expired entries are dropped
+    lazily on access, and the least recently written entries are evicted
+    once max_entries is exceeded.
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at), oldest write first
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        return entry[1] <= now
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry, now):
+                del self._entries[key]
+                return default
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds (default: the store's ttl)."""
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, now + (self.ttl if ttl is None else ttl))
+            self._evict(now)
+
+    def _evict(self, now):
+        # Entries are ordered by write time, so expired ones cluster at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not self._expired(entry, now) and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]